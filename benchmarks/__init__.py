@@ -0,0 +1 @@
+""" Screening benchmarks, run from the folder containing NameEvaluator_conf.ini (or the repo root) with python -m benchmarks.run """
@@ -0,0 +1,202 @@
+""" Time the screening pipeline over a grid of avoids and names counts, on synthetic data, and write the timings as JSON.
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --avoids 100,1000 --names 10,1000 --output after.json --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.synthetic import CATEGORIES, MASTER_CATEGORIES, make_avoids_df, make_names, make_project_competitor_text, write_avoids_workbook
+from src.utils.check_names import check_names_for_avoids
+from src.utils.get_avoids_data import get_avoids_from_file, parse_project_competitor_avoids
+
+
+### Bump when the data generator or what a benchmark times changes, results of different versions don't compare
+BENCHMARK_VERSION = 1
+
+DEFAULT_AVOIDS = '100,1000,10000,100000'
+DEFAULT_NAMES = '10,1000,10000,50000'
+
+
+def time_runs(func, repeat):
+    """ Returns wall clock seconds of repeat calls of func. """
+
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+
+    return runs
+
+
+def make_result(bench, params, runs):
+    """ Returns a result row, min is the figure to compare as it is the least affected by other load on the machine. """
+
+    return {
+        'bench':    bench,
+        'params':   params,
+        'runs':     runs,
+        'min':      min(runs),
+        'median':   statistics.median(runs),
+        }
+
+
+def bench_check_names(avoids_sizes, names_sizes, repeat, seed, workers):
+    """ check_names_for_avoids over every (avoids, names) pair, every category checked.
+        The avoids dataframe is passed as is, so the time includes indexing the avoids.
+        workers is only passed when given, otherwise SCREEN_WORKERS from the config applies.
+    """
+
+    checked_avoids = {cat: True for cat in CATEGORIES}
+    kwargs = {} if workers is None else {'workers': workers}
+    for n_avoids in avoids_sizes:
+        avoids_df = make_avoids_df(n_avoids, seed)
+        for n_names in names_sizes:
+            names_list = make_names(n_names, seed)
+            runs = time_runs(lambda: check_names_for_avoids(names_list, [], avoids_df, checked_avoids, **kwargs), repeat)
+            yield make_result('check_names_for_avoids', {'avoids': n_avoids, 'names': n_names, **kwargs}, runs)
+
+
+def bench_get_avoids(avoids_sizes, repeat, seed):
+    """ get_avoids_from_file for a master workbook of every size, parsing the workbook and then reading the parsed avoids cache. """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_avoids in avoids_sizes:
+            file_path = os.path.join(tmp_dir, f'avoids_{n_avoids}.xlsx')
+            cache_path = os.path.join(tmp_dir, f'avoids_{n_avoids}.cache')
+            write_avoids_workbook(make_avoids_df(n_avoids, seed, MASTER_CATEGORIES), file_path)
+
+            config = {'PATH_TO_AVOIDS_FILE': file_path, 'AVOIDS_CACHE_PATH': ''}
+            runs = time_runs(lambda: get_avoids_from_file(None, config), repeat)
+            yield make_result('get_avoids_from_file', {'avoids': n_avoids, 'source': 'workbook'}, runs)
+
+            ### First read writes the cache, only the reads after it are timed
+            config = {'PATH_TO_AVOIDS_FILE': file_path, 'AVOIDS_CACHE_PATH': cache_path}
+            get_avoids_from_file(None, config)
+            runs = time_runs(lambda: get_avoids_from_file(None, config), repeat)
+            yield make_result('get_avoids_from_file', {'avoids': n_avoids, 'source': 'cache'}, runs)
+
+
+def bench_parse_project_competitor(avoids_sizes, repeat, seed):
+    """ parse_project_competitor_avoids for project/competitor/internal text of every size. """
+
+    for n_avoids in avoids_sizes:
+        texts = make_project_competitor_text(n_avoids, seed)
+        runs = time_runs(lambda: parse_project_competitor_avoids(*texts), repeat)
+        yield make_result('parse_project_competitor_avoids', {'avoids': n_avoids}, runs)
+
+
+### Benchmarks by name, each taking the parsed arguments and yielding result rows
+BENCHMARKS = {
+    'check_names_for_avoids':           lambda args: bench_check_names(args.avoids, args.names, args.repeat, args.seed, args.workers),
+    'get_avoids_from_file':             lambda args: bench_get_avoids(args.avoids, args.repeat, args.seed),
+    'parse_project_competitor_avoids':  lambda args: bench_parse_project_competitor(args.avoids, args.repeat, args.seed),
+}
+
+
+def get_commit():
+    """ Returns the current git commit, with a -dirty suffix for uncommitted changes, None outside a git checkout. """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return f'{commit}-dirty' if dirty else commit
+
+
+def result_key(result):
+    """ Key matching a result with the same benchmark and parameters in another run. """
+    return result['bench'], tuple(sorted(result['params'].items()))
+
+
+def format_params(params):
+    """ Returns params as a short string, e.g. 'avoids=1000 names=10'. """
+    return ' '.join(f'{k}={v}' for k, v in params.items())
+
+
+def compare(baseline, results, file_obj):
+    """ Print each result's min time against the same benchmark in a baseline run, with the speedup. """
+
+    if baseline.get('version') != BENCHMARK_VERSION:
+        print(f"Baseline is benchmark version {baseline.get('version')}, not {BENCHMARK_VERSION}, timings may not compare", file=file_obj)
+
+    baseline_mins = {result_key(r): r['min'] for r in baseline['results']}
+    print(f"{'benchmark':<34}{'params':<34}{'baseline':>11}{'current':>11}{'speedup':>9}", file=file_obj)
+    for result in results:
+        old = baseline_mins.get(result_key(result))
+        old_text, speedup = ('--', '--') if old is None else (f'{old:.4f}', f'{old / result["min"]:.2f}x')
+        print(f"{result['bench']:<34}{format_params(result['params']):<34}{old_text:>11}{result['min']:>11.4f}{speedup:>9}", file=file_obj)
+
+
+def parse_sizes(text):
+    """ Parse comma separated counts. """
+    return [int(i) for i in text.split(',') if i.strip()]
+
+
+def get_parser():
+    """ Build the argument parser. """
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='NameEvaluator screening benchmarks')
+    parser.add_argument('--avoids', type=parse_sizes, default=parse_sizes(DEFAULT_AVOIDS), help=f'Comma separated avoids counts (default {DEFAULT_AVOIDS})')
+    parser.add_argument('--names', type=parse_sizes, default=parse_sizes(DEFAULT_NAMES), help=f'Comma separated names counts, for check_names_for_avoids (default {DEFAULT_NAMES})')
+    parser.add_argument('--only', choices=list(BENCHMARKS), action='append', help='Run only this benchmark, can be repeated')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per grid point (default 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic data seed (default 0)')
+    parser.add_argument('--workers', type=int, help='Screening worker processes, defaults to SCREEN_WORKERS from the config')
+    parser.add_argument('--output', '-o', help='JSON results file, stdout if not given')
+    parser.add_argument('--compare', help='JSON results file of an earlier run to compare against')
+    return parser
+
+
+def main(argv=None):
+    """ Run the selected benchmarks, returns the exit code. """
+
+    args = get_parser().parse_args(argv)
+
+    results = []
+    for bench in args.only or BENCHMARKS:
+        for result in BENCHMARKS[bench](args):
+            print(f"{result['bench']:<34}{format_params(result['params']):<34}{result['min']:>11.4f}", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        'version':      BENCHMARK_VERSION,
+        'commit':       get_commit(),
+        'created_at':   datetime.now().isoformat(timespec='seconds'),
+        'python':       platform.python_version(),
+        'pandas':       pd.__version__,
+        'platform':     platform.platform(),
+        'args':         {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results':      results,
+        }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), results, sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
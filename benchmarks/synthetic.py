@@ -0,0 +1,101 @@
+""" Deterministic synthetic avoids and names for the benchmarks.
+    The same (size, seed) always gives the same data, so timings can be compared between commits.
+"""
+import random
+
+import openpyxl
+import pandas as pd
+
+import src.utils.constants as c
+
+
+### Only constants are imported from src, so this module (and run.py) can be copied onto older checkouts to time them
+AVOIDS_FIELDS = [c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD, c.CATEGORY_FIELD]
+
+CONSONANTS = 'bcdfghklmnprstvxz'
+VOWELS = 'aeiou'
+
+### Categories with a sheet in the master avoids workbook, project/competitor avoids are entered by users
+MASTER_CATEGORIES = (c.INN, c.LINGUISTIC, c.MARKET_RESEARCH)
+CATEGORIES = MASTER_CATEGORIES + (c.PROJECT, c.COMPETITOR)
+
+### Avoid types with the relative share of avoids and value length range of each
+AVOID_TYPES = {
+    c.PREFIX:           (0.25, (2, 4)),
+    c.INFIX:            (0.15, (2, 4)),
+    c.SUFFIX:           (0.25, (2, 4)),
+    c.ANYWHERE:         (0.10, (2, 4)),
+    c.STRING_COMPARE:   (0.25, (5, 10)),
+}
+
+
+def make_word(rnd, min_length, max_length):
+    """ Returns a lower-case word of alternating consonants and vowels, so short avoids actually occur in names. """
+
+    length = rnd.randint(min_length, max_length)
+    start = rnd.random() < 0.5
+    return ''.join(rnd.choice(CONSONANTS if (i % 2 == 0) == start else VOWELS) for i in range(length))
+
+
+def make_avoids_df(n_avoids, seed=0, categories=CATEGORIES):
+    """ Returns an avoids dataframe (value, type, description, category) of n_avoids rows spread over categories and every avoid type. """
+
+    rnd = random.Random(f'avoids-{seed}')
+    types = list(AVOID_TYPES)
+    weights = [AVOID_TYPES[t][0] for t in types]
+
+    columns = {field: [] for field in AVOIDS_FIELDS}
+    for i in range(n_avoids):
+        avoid_type = rnd.choices(types, weights)[0]
+        columns[c.VALUE_FIELD].append(make_word(rnd, *AVOID_TYPES[avoid_type][1]))
+        columns[c.TYPE_FIELD].append(avoid_type)
+        columns[c.DESCRIPTION_FIELD].append(f'desc {i}' if rnd.random() < 0.8 else '--')
+        columns[c.CATEGORY_FIELD].append(categories[i % len(categories)])
+
+    return pd.DataFrame(columns, columns=AVOIDS_FIELDS)
+
+
+def write_avoids_workbook(avoids_df, file_path):
+    """ Write the master categories of an avoids dataframe as a master avoids workbook, one sheet per category. """
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for category in MASTER_CATEGORIES:
+        sheet = workbook.create_sheet(category)
+        sheet.append([c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD])
+
+        rows = avoids_df[avoids_df[c.CATEGORY_FIELD] == category]
+        for value, avoid_type, desc in zip(rows[c.VALUE_FIELD], rows[c.TYPE_FIELD], rows[c.DESCRIPTION_FIELD]):
+            sheet.append([value, avoid_type, None if desc == '--' else desc])
+
+    workbook.save(file_path)
+
+
+def make_names(n_names, seed=0):
+    """ Returns a sorted list of n_names distinct candidate names, 5 to 10 letters, capitalized as entered in the GUI. """
+
+    rnd = random.Random(f'names-{seed}')
+    names = set()
+    while len(names) < n_names:
+        names.add(make_word(rnd, 5, 10).capitalize())
+
+    return sorted(names)
+
+
+def make_project_competitor_text(n_avoids, seed=0):
+    """ Returns (project, competitor, internal) text area contents with n_avoids lines in total.
+        Project avoids use every signifier form (pre-, -suf, -inf-, "any"), competitor and internal lines are plain names.
+    """
+
+    rnd = random.Random(f'user-avoids-{seed}')
+    forms = ['{}-', '-{}', '-{}-', '"{}"', '*{}*', '{}']
+
+    project, competitor, internal = [], [], []
+    for i in range(n_avoids):
+        if i % 3 == 0:
+            project.append(rnd.choice(forms).format(make_word(rnd, 2, 4)))
+        elif i % 3 == 1:
+            competitor.append(make_word(rnd, 5, 10).capitalize())
+        else:
+            internal.append(make_word(rnd, 5, 10).capitalize())
+
+    return '\n'.join(project), '\n'.join(competitor), '\n'.join(internal)
@@ -1,4 +1,8 @@
+from multiprocessing import freeze_support
+
 from src.main import run
 
 if __name__ == '__main__':
+    ### Required for the screening process pool in a frozen (pyinstaller) exe
+    freeze_support()
     run()
\ No newline at end of file
@@ -459,6 +459,15 @@ class Ui_NameEvaluator(object):
         self.btn_check_names.setStyleSheet("")
         self.btn_check_names.setObjectName("btn_check_names")
         self.horizontalLayout_19.addWidget(self.btn_check_names)
+        self.btn_cancel_check = QtWidgets.QPushButton(self.main_tab)
+        self.btn_cancel_check.setEnabled(False)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.btn_cancel_check.sizePolicy().hasHeightForWidth())
+        self.btn_cancel_check.setSizePolicy(sizePolicy)
+        self.btn_cancel_check.setObjectName("btn_cancel_check")
+        self.horizontalLayout_19.addWidget(self.btn_cancel_check)
         self.verticalLayout_3.addLayout(self.horizontalLayout_19)
         self.horizontalLayout_6 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_6.setObjectName("horizontalLayout_6")
@@ -477,6 +486,9 @@ class Ui_NameEvaluator(object):
         self.btn_lower_case.setStyleSheet("")
         self.btn_lower_case.setObjectName("btn_lower_case")
         self.horizontalLayout_6.addWidget(self.btn_lower_case)
+        self.btn_names_file = QtWidgets.QToolButton(self.main_tab)
+        self.btn_names_file.setObjectName("btn_names_file")
+        self.horizontalLayout_6.addWidget(self.btn_names_file)
         self.verticalLayout_3.addLayout(self.horizontalLayout_6)
         self.horizontalLayout.addLayout(self.verticalLayout_3)
         self.line_4 = QtWidgets.QFrame(self.main_tab)
@@ -560,6 +572,9 @@ class Ui_NameEvaluator(object):
         self.horizontalLayout_21.addWidget(self.btn_exit)
         spacerItem4 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_21.addItem(spacerItem4)
+        self.btn_export_results = QtWidgets.QPushButton(self.main_tab)
+        self.btn_export_results.setObjectName("btn_export_results")
+        self.horizontalLayout_21.addWidget(self.btn_export_results)
         self.gridLayout.addLayout(self.horizontalLayout_21, 2, 0, 1, 1)
         self.MainTab.addTab(self.main_tab, "")
         self.avoids_tab = QtWidgets.QWidget()
@@ -752,18 +767,24 @@ class Ui_NameEvaluator(object):
         self.btn_check_names.setStatusTip(_translate("NameEvaluator", "Commit and run names against all selected avoids [Ctrl+ Enter]"))
         self.btn_check_names.setText(_translate("NameEvaluator", "Check Names"))
         self.btn_check_names.setShortcut(_translate("NameEvaluator", "Ctrl+Return"))
+        self.btn_cancel_check.setStatusTip(_translate("NameEvaluator", "Stop the running name check, conflicts found so far are kept"))
+        self.btn_cancel_check.setText(_translate("NameEvaluator", "Cancel"))
         self.btn_upper_case.setStatusTip(_translate("NameEvaluator", "Set all names to uppercase"))
         self.btn_upper_case.setText(_translate("NameEvaluator", "ABC"))
         self.btn_title_case.setStatusTip(_translate("NameEvaluator", "Set all names to title case"))
         self.btn_title_case.setText(_translate("NameEvaluator", "Abc"))
         self.btn_lower_case.setStatusTip(_translate("NameEvaluator", "Set all names to lowercase"))
         self.btn_lower_case.setText(_translate("NameEvaluator", "abc"))
+        self.btn_names_file.setStatusTip(_translate("NameEvaluator", "Screen names from a text, CSV or Excel file, every conflict is written to a results file"))
+        self.btn_names_file.setText(_translate("NameEvaluator", "File..."))
         self.name_conflict_label.setText(_translate("NameEvaluator", "Conflicts"))
         self.qtable_results.setStatusTip(_translate("NameEvaluator", "Results of avoid checks here"))
         self.lineedit_ignore.setStatusTip(_translate("NameEvaluator", "Enter a INN stems to be ignored (e.g vir, axo, imex)"))
         self.lineedit_ignore.setPlaceholderText(_translate("NameEvaluator", "Enter INN stems to ignore here... (e.g. vir, axo, imex)"))
         self.btn_exit.setStatusTip(_translate("NameEvaluator", "Exit the application"))
         self.btn_exit.setText(_translate("NameEvaluator", "      Exit      "))
+        self.btn_export_results.setStatusTip(_translate("NameEvaluator", "Export the conflicts to an Excel, CSV or JSON lines file"))
+        self.btn_export_results.setText(_translate("NameEvaluator", "Export Results..."))
         self.MainTab.setTabText(self.MainTab.indexOf(self.main_tab), _translate("NameEvaluator", "Main"))
         self.qtable_avoids.setStatusTip(_translate("NameEvaluator", "Complete list of all avoids"))
         self.btn_reload_avoids.setStatusTip(_translate("NameEvaluator", "Reload avoids from master list only"))
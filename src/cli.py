@@ -0,0 +1,225 @@
+""" Headless command line entry point, screens names without starting the GUI.
+    Never imports Qt, so it can run on servers and in containers.
+
+    python -m src.cli screen names.txt --categories inn,competitor --ignore vir,mab --output results.csv
+    python -m src.cli screen candidates.xlsx --stream --output results.jsonl
+    python -m src.cli export results.csv --per-hit --output conflicts.xlsx
+    python -m src.cli history daxorel --prefix
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+
+import src.utils.constants as c
+from src.utils.avoid_index import AvoidIndex
+from src.utils.check_names import group_hit_labels, hits_cache_key, screen_names
+from src.utils.common_utils import TRACER, Logger, Timer, UserError
+from src.utils.get_avoids_data import get_all_avoids, parse_project_competitor_avoids, read_project_competitor_from_file
+from src.utils.history import open_history
+from src.utils.metrics import METRICS, STAGE_BUILD_INDEX, STAGE_LOAD_AVOIDS, report_run
+from src.utils.name_stream import iter_names_file, screen_names_file
+from src.utils.result_writers import RESULT_WRITERS, open_result_writer, read_results_file, write_results
+
+
+### Category names by their config shorthand (e.g. inn, market_research)
+CATEGORIES_BY_SHORTHAND = {v: k for k, v in c.SHORTHAND_MAPPING.items()}
+
+
+def parse_categories(text):
+    """ Parse comma separated category shorthands, all categories if empty. """
+
+    if not text:
+        return list(c.SHORTHAND_MAPPING)
+
+    categories = []
+    for shorthand in (i.strip().lower() for i in text.split(',') if i.strip()):
+        if shorthand not in CATEGORIES_BY_SHORTHAND:
+            raise UserError(f"Unknown category '{shorthand}', expected one of: {', '.join(CATEGORIES_BY_SHORTHAND)}")
+        categories.append(CATEGORIES_BY_SHORTHAND[shorthand])
+
+    return categories
+
+
+def read_text_file(file_path):
+    """ Returns file contents, empty string if no path given. """
+
+    if not file_path:
+        return ''
+
+    with open(file_path, encoding='utf-8') as f:
+        return f.read()
+
+
+def read_names(file_path):
+    """ Read names from a text (one per line), CSV or Excel file, stripped, de-duplicated and sorted as in the GUI. """
+    return sorted(set(iter_names_file(file_path)))
+
+
+def load_avoids(logger, config, args):
+    """ Load master avoids plus any project/competitor/internal avoids, as the GUI does on startup. """
+
+    if args.saved_avoids:
+        proj_text, comp_text, intr_text = read_project_competitor_from_file(config)
+    else:
+        proj_text, comp_text, intr_text = '', '', ''
+
+    proj_text = '\n'.join([proj_text, read_text_file(args.project)])
+    comp_text = '\n'.join([comp_text, read_text_file(args.competitor)])
+    intr_text = '\n'.join([intr_text, read_text_file(args.internal)])
+
+    addtl_avoids_df = None
+    if proj_text.strip() or comp_text.strip() or intr_text.strip():
+        addtl_avoids_df = parse_project_competitor_avoids(proj_text, comp_text, intr_text)
+
+    return get_all_avoids(logger, config, addtl_avoids_df)
+
+
+def screen(args):
+    """ Screen a names file, streaming one row per name with conflicts to the output. """
+
+    config = c.get_config()
+    logger = Logger('CLI Logger')
+    logger.setup(config)
+
+    categories = parse_categories(args.categories)
+    ignore_list = [i.strip() for i in args.ignore.split(',')]
+
+    ### Streamed names are only read once screening starts, a chunk at a time
+    names_list = None
+    if not args.stream:
+        names_list = read_names(args.names_file)
+        if names_list == []:
+            raise UserError("No names entered!")
+
+    with Timer(None, STAGE_LOAD_AVOIDS, METRICS):
+        avoids_df = load_avoids(logger, config, args)
+    with Timer(None, STAGE_BUILD_INDEX, METRICS):
+        avoid_index = AvoidIndex(avoids_df)
+    allowed = avoid_index.allowed_mask(categories, ignore_list)
+
+    ### Names screened before against the same avoids, categories and ignore list are read from the history
+    history = None if args.no_history else open_history(logger, config)
+    if history is not None:
+        history.add_avoid_set(avoid_index)
+
+    screened = 0
+    conflicts = 0
+    try:
+        with open_result_writer(args.output, categories, args.format, args.per_hit) as writer:
+            cache_key = hits_cache_key(avoid_index, categories, ignore_list)
+            if args.stream:
+                names = screen_names_file(args.names_file, avoid_index, allowed, args.chunk_size, args.workers, history, cache_key)
+            else:
+                names = screen_names(names_list, avoid_index, allowed, args.workers, history, cache_key)
+
+            for name, hits in names:
+                screened += 1
+                if hits:
+                    writer.write(name, group_hit_labels(avoid_index, name, hits))
+                    conflicts += 1
+    finally:
+        if history is not None:
+            history.close()
+
+    if screened == 0:
+        raise UserError("No names entered!")
+
+    logger.info(f'Screened {screened} names against {len(avoid_index)} avoids, {conflicts} with conflicts')
+    report_run(logger, config, 'screen', {'names': screened, 'avoids': len(avoid_index), 'conflicts': conflicts})
+    if TRACER.enabled:
+        TRACER.log_summary(logger)
+
+
+def export(args):
+    """ Convert a results file written a row per name (e.g. by screen or the GUI) to another format, or to a row per conflict. """
+
+    if args.output == args.results_file:
+        raise UserError("Output file must differ from the results file")
+
+    categories, results = read_results_file(args.results_file)
+    try:
+        write_results(args.output, categories, results, args.format, args.per_hit)
+    finally:
+        results.close()
+
+
+def history(args):
+    """ Print past screens of a name (or names starting with it), one JSON object per screen, most recent first. """
+
+    config = c.get_config()
+    store = open_history(None, config)
+    if store is None:
+        raise UserError("Screening history is disabled or could not be opened, see HISTORY_PATH in NameEvaluator_conf.ini")
+
+    try:
+        for entry in store.find(args.name, prefix=args.prefix, limit=args.limit):
+            conflicts = {}
+            for category, label in entry.conflicts:
+                conflicts.setdefault(category, []).append(label)
+
+            print(json.dumps({
+                'name':         entry.name,
+                'screened_at':  datetime.fromtimestamp(entry.screened_at).isoformat(timespec='seconds'),
+                'avoids':       entry.version,
+                'categories':   entry.categories,
+                'ignore':       entry.ignore_list,
+                'conflicts':    conflicts,
+                }))
+    finally:
+        store.close()
+
+
+def get_parser():
+    """ Build the argument parser. """
+
+    parser = argparse.ArgumentParser(prog='python -m src.cli', description='NameEvaluator headless screening')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    screen_parser = subparsers.add_parser('screen', help='Screen a file of names (one per line) against the avoids')
+    screen_parser.add_argument('names_file', help='Text file with one name per line, or a CSV/Excel file of names (Name column, else the first)')
+    screen_parser.add_argument('--categories', default='', help=f"Comma separated categories to screen against, default all ({','.join(CATEGORIES_BY_SHORTHAND)})")
+    screen_parser.add_argument('--ignore', default='', help='Comma separated INN stems to ignore (e.g. vir,mab)')
+    screen_parser.add_argument('--project', help='Text file of project avoids, same syntax as the Project Avoids text area')
+    screen_parser.add_argument('--competitor', help='Text file of competitor names, one per line')
+    screen_parser.add_argument('--internal', help='Text file of internal names, one per line')
+    screen_parser.add_argument('--saved-avoids', action='store_true', help='Include project/competitor/internal avoids saved in NameEvaluator_conf.ini')
+    screen_parser.add_argument('--output', '-o', help='Output file, stdout if not given')
+    screen_parser.add_argument('--format', choices=list(RESULT_WRITERS), help='Output format, from the output file extension if not given (default csv)')
+    screen_parser.add_argument('--per-hit', action='store_true', help='Write a row per conflict (Name, Category, Conflict) instead of a row per name')
+    screen_parser.add_argument('--workers', type=int, help='Worker processes, defaults to SCREEN_WORKERS from the config')
+    screen_parser.add_argument('--no-history', action='store_true', help='Screen every name, without reading or recording the screening history')
+    screen_parser.add_argument('--stream', action='store_true', help='Read and screen names a chunk at a time in file order, for lists too big to hold in memory')
+    screen_parser.add_argument('--chunk-size', type=int, help='Names per chunk with --stream, defaults to STREAM_CHUNK_SIZE from the config')
+    screen_parser.set_defaults(func=screen)
+
+    export_parser = subparsers.add_parser('export', help='Convert a results file to another format, or to a row per conflict')
+    export_parser.add_argument('results_file', help='Results file (csv, jsonl or xlsx) with a row per name')
+    export_parser.add_argument('--output', '-o', help='Output file, stdout if not given')
+    export_parser.add_argument('--format', choices=list(RESULT_WRITERS), help='Output format, from the output file extension if not given (default csv)')
+    export_parser.add_argument('--per-hit', action='store_true', help='Write a row per conflict (Name, Category, Conflict) instead of a row per name')
+    export_parser.set_defaults(func=export)
+
+    history_parser = subparsers.add_parser('history', help='Show past screens of a name from the screening history')
+    history_parser.add_argument('name', help='Name to look up, case insensitive')
+    history_parser.add_argument('--prefix', action='store_true', help='Show every name starting with NAME')
+    history_parser.add_argument('--limit', type=int, default=100, help='Most recent screens to show (default 100)')
+    history_parser.set_defaults(func=history)
+
+    return parser
+
+
+def main(argv=None):
+    """ Command line entry point, returns the exit code. """
+
+    args = get_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except UserError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,21 @@
+import os
 import sys
 import traceback
 
-import pandas as pd
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QErrorMessage
 
 import src.utils.constants as c
 from src.UI.ui_lbb_name_evaluator import Ui_NameEvaluator
-from src.utils.data_models import QTPandasModel, UserError
-from src.utils.check_names import check_names_for_avoids
-from src.utils.common_utils import Logger, error_handler
-from src.utils.get_avoids_data import get_avoids_from_file, parse_project_competitor_avoids, save_project_competitor_to_file, read_project_competitor_from_file
+from src.utils.data_models import LazyPandasModel, QTPandasModel
+from src.utils.avoid_index import AvoidIndex
+from src.utils.common_utils import TRACER, Logger, LRUCache, TieredCache, Timer, UserError, error_handler
+from src.utils.history import open_history
+from src.utils.metrics import METRICS, STAGE_BUILD_INDEX, STAGE_LOAD_AVOIDS, STAGE_TABLE_RENDER, report_run
+from src.utils.workers import FileScreenWorker, FunctionWorker, ScreenWorker
+
+### pandas and modules using it (get_avoids_data, search_index) are imported where first used,
+# the first of which is the avoids load on a worker thread after the window is shown
 
 
 class UIMain(QMainWindow):
@@ -19,8 +24,21 @@ class UIMain(QMainWindow):
     _names_list = []
     ignore_list = []
     avoids_df = None
+    avoid_index = None
+    avoids_search = None
     results_df = None
+    screen_session = None
     checked_categories = {}
+    screen_thread = None
+    screen_worker = None
+    screen_pool = None
+    avoids_thread = None
+    avoids_worker = None
+    export_thread = None
+    export_worker = None
+
+    ### (path, per_hit) of the results file of the last names file check, when the table only shows its first conflicts
+    results_file = None
 
     busy_cursor = QtCore.Qt.BusyCursor
     default_cursor = QtCore.Qt.ArrowCursor
@@ -37,30 +55,43 @@ class UIMain(QMainWindow):
         self.logger = Logger('App Logger')
         self.logger.setup(self.config)
 
+        ### Hits per name, kept across checks so re-runs only screen new names
+        # backed by the on-disk screening history (if enabled) so they also carry over between sessions
+        self.history = open_history(self.logger, self.config)
+        self.hits_cache = LRUCache(c.SCREEN_CACHE_SIZE)
+        if self.history is not None:
+            self.hits_cache = TieredCache(self.hits_cache, self.history)
+
         ### Set up error dialogue widget
         self.err_dialogue = QErrorMessage(self)
         self.err_dialogue.setWindowModality(QtCore.Qt.WindowModal)
 
         ### Set button onClik actions
         self.ui.btn_check_names.clicked.connect(self.check_names)
+        self.ui.btn_cancel_check.clicked.connect(self.cancel_check_names)
         self.ui.btn_upper_case.clicked.connect(self.set_names_uppercase)
         self.ui.btn_title_case.clicked.connect(self.set_names_titlecase)
         self.ui.btn_lower_case.clicked.connect(self.set_names_lowercase)
+        self.ui.btn_names_file.clicked.connect(self.check_names_file)
+        self.ui.btn_export_results.clicked.connect(self.export_results)
         self.ui.btn_save_avoids.clicked.connect(self.save_project_competitor_avoids)
         self.ui.btn_clear_avoids.clicked.connect(self.clear_avoids)
         self.ui.btn_reload_avoids.clicked.connect(self.reload_avoids)
         self.ui.btn_exit.clicked.connect(self.close_app)
         self.ui.lineedit_filter_avoids.textChanged.connect(self.filter_avoids_table)
 
-        ### Set check/uncheck all box to do exactly that
-        self.ui.checkbox_all.stateChanged.connect(self.check_uncheck_all)
+        ### Progress of a running name check, shown in the status bar
+        self.progress_check = QtWidgets.QProgressBar(self)
+        self.progress_check.setMaximumWidth(250)
+        self.progress_check.hide()
+        self.ui.statusbar.addPermanentWidget(self.progress_check)
 
-        ### Set initial avoids data, loads from 'master' file
-        self.set_avoids_table_data()
+        ### Row heights of qtable_results follow what is in view
+        self.ui.qtable_results.verticalScrollBar().valueChanged.connect(self.resize_visible_result_rows)
+        self.ui.qtable_results.horizontalHeader().sectionResized.connect(self.resize_visible_result_rows)
 
-        ### Set up avoids entered/saved from last session
-        self.set_project_competitor_avoids_from_file()
-        self.save_project_competitor_avoids_start()
+        ### Set check/uncheck all box to do exactly that
+        self.ui.checkbox_all.stateChanged.connect(self.check_uncheck_all)
 
         ### Assign a clickable component to these objects
         # Allows the user to still check the box even if not directly on the text
@@ -86,38 +117,148 @@ class UIMain(QMainWindow):
             self.ui.MainWindow.setStyleSheet("")
             self.ui.MainTab.setStyleSheet("")
 
+        ### Load master avoids plus those saved from last session once the window is up
+        self.set_avoids_loading(True)
+        QtCore.QTimer.singleShot(0, self.load_saved_avoids)
+
+    @error_handler
+    def load_saved_avoids(self):
+        """ Startup load, avoids from the master file plus project/competitor avoids saved from last session. """
+
+        self.start_avoids_worker(self.read_avoids, saved=True)
+
     @error_handler
     def set_avoids_table_data(self, upd_df=None):
-        """ Set qtable_avoids to have the expected data.
+        """ Reload avoids on a worker thread, qtable_avoids and the avoid index are set once loaded.
             upd_df is expected when user saves project and/or competitor avoids.
         """
-        if upd_df is None:
-            self.avoids_df = get_avoids_from_file(self.logger, self.config)
-        else:
-            self.avoids_df = pd.concat([get_avoids_from_file(self.logger, self.config), upd_df])
 
-        if self.avoids_df is None:
-            raise UserError("Master avoids file could not be found/read\nPlease check the path defined in NameEvaluator_conf.ini")
+        ### Results of the last check are carried over to the new avoids, unless a check is still running
+        session = self.screen_session if self.screen_thread is None else None
+        self.start_avoids_worker(self.read_avoids, upd_df, session=session)
 
-        self.avoids_df.drop_duplicates(subset=[c.VALUE_FIELD, c.TYPE_FIELD, c.CATEGORY_FIELD], inplace=True)
+    def start_avoids_worker(self, func, *args, **kwargs):
+        """ Run an avoids load on a worker thread, Check Names is disabled until it is done. """
 
-        ### Qtable uses custom pandas model
-        self.ui.qtable_avoids.setModel(QTPandasModel(self.avoids_df))
+        ### Only one load at a time, the avoids buttons are disabled while one runs
+        if self.avoids_thread is not None:
+            return
 
-        ### Stretch headers to fit
-        header = self.ui.qtable_avoids.horizontalHeader()
-        header.setSectionResizeMode(2, QtWidgets.QHeaderView.Stretch)
+        self.set_avoids_loading(True)
+        self.avoids_worker = FunctionWorker(func, *args, **kwargs)
+        self.avoids_worker.finished.connect(self.finish_avoids_load)
+        self.avoids_worker.failed.connect(self.fail_avoids_load)
+        self.avoids_thread = self.start_worker_thread(self.avoids_worker)
+
+    def read_avoids(self, upd_df=None, saved=False, session=None):
+        """ Read all avoids and compile their index, runs on the avoids worker thread.
+            With saved=True the project/competitor avoids saved in the config are parsed and added,
+            and their text is returned to fill the text areas.
+            A ScreenSession of the last check is moved onto the new avoids, screening only the avoids added.
+        """
+        from src.utils.get_avoids_data import get_all_avoids, parse_project_competitor_avoids, read_project_competitor_from_file
+        from src.utils.search_index import RowSearchIndex
 
-        ### Sorting enabled
-        self.ui.qtable_avoids.setSortingEnabled(True)
-        self.ui.qtable_avoids.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        saved_texts = None
+        with Timer(None, STAGE_LOAD_AVOIDS, METRICS):
+            if saved:
+                saved_texts = read_project_competitor_from_file(self.config)
+                if any(i.strip() for i in saved_texts):
+                    upd_df = parse_project_competitor_avoids(*saved_texts)
+
+            avoids_df = get_all_avoids(self.logger, self.config, upd_df)
+
+        ### Compile the avoid index once per avoids change, reused by every check
+        with Timer(None, STAGE_BUILD_INDEX, METRICS):
+            avoid_index = AvoidIndex(avoids_df)
+        if self.history is not None:
+            self.history.add_avoid_set(avoid_index)
+
+        ### Search index for the avoids filter, on value only (case sensitive) or all fields as configured
+        if self.config.get('FILTER_AVOIDS_ON_VALUE_ONLY', '0') == '1':
+            avoids_search = RowSearchIndex(avoids_df, [c.VALUE_FIELD], case_sensitive=True)
+        else:
+            avoids_search = RowSearchIndex(avoids_df, [c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD, c.CATEGORY_FIELD])
+
+        if session is not None:
+            session = session.rebase(avoid_index)
+
+        return avoids_df, avoid_index, avoids_search, saved_texts, session
 
     @error_handler
-    def set_filtered_avoids_table_data(self, filtered_df):
-        """ Set qtable_avoids to filtered data. """
+    def finish_avoids_load(self, result):
+        """ Show the loaded avoids and enable Check Names. """
+
+        self.avoids_df, self.avoid_index, self.avoids_search, saved_texts, session = result
+        self.stop_avoids_thread()
+
+        ### Pool workers hold the previous avoids, they are restarted with the new ones by the next check
+        if self.screen_pool is not None and self.screen_thread is None:
+            self.screen_pool.shutdown()
+
+        ### Set up avoids entered/saved from last session
+        if saved_texts is not None:
+            proj_text, comp_text, intr_text = saved_texts
+            self.ui.text_project_avoids.setPlainText(proj_text)
+            self.ui.text_competitor.setPlainText(comp_text)
+            self.ui.text_internal_names.setPlainText(intr_text)
+
+        ### One model per avoids load, the filter only changes which of its rows are shown
+        with Timer(None, STAGE_TABLE_RENDER, METRICS):
+            self.set_avoids_table_model(QTPandasModel(self.avoids_df))
+            self.filter_avoids_table(self.ui.lineedit_filter_avoids.text())
+        self.ui.statusbar.showMessage(f'Loaded {len(self.avoids_df):,} avoids', 5000)
+
+        ### Results of the last check updated for the new avoids, and cached for the next check of the same names
+        if session is not None and self.screen_thread is None:
+            self.screen_session = session
+            self.screen_session.fill_cache(self.hits_cache)
+            self.results_df = self.screen_session.to_df()
+            self.set_results_table_data()
+            self.ui.statusbar.showMessage(f'Loaded {len(self.avoids_df):,} avoids, updated conflicts for {len(session):,} names', 5000)
+        else:
+            self.screen_session = None
+
+        report_run(self.logger, self.config, 'load_avoids', {'avoids': len(self.avoid_index)})
+
+    def fail_avoids_load(self, err, tb):
+        """ Route an error raised while loading avoids to the usual dialogues. """
+
+        self.stop_avoids_thread()
+        self.show_worker_error(err, tb)
+
+    def stop_avoids_thread(self):
+        """ Wait for the avoids thread to wind down and leave the loading state. """
+
+        if self.avoids_thread is not None:
+            self.stop_worker_thread(self.avoids_thread)
+            self.avoids_thread = None
+            self.avoids_worker = None
+
+        self.set_avoids_loading(False)
+
+    def set_avoids_loading(self, loading):
+        """ Toggle controls between loading avoids and ready.
+            Check Names stays disabled while loading and after a failed load, until avoids are available.
+        """
+
+        self.ui.btn_check_names.setEnabled(not loading and self.avoid_index is not None and self.screen_thread is None)
+        self.ui.btn_names_file.setEnabled(self.ui.btn_check_names.isEnabled())
+        self.ui.btn_save_avoids.setEnabled(not loading)
+        self.ui.btn_clear_avoids.setEnabled(not loading)
+        self.ui.btn_reload_avoids.setEnabled(not loading)
+        self.ui.lineedit_filter_avoids.setEnabled(not loading)
+
+        if loading:
+            self.ui.statusbar.showMessage('Loading avoids...')
+        else:
+            self.ui.statusbar.clearMessage()
+
+    def set_avoids_table_model(self, model):
+        """ Set the model for qtable_avoids, sorted on the first column. """
 
         ### Qtable uses custom pandas model
-        self.ui.qtable_avoids.setModel(QTPandasModel(filtered_df))
+        self.ui.qtable_avoids.setModel(model)
 
         ### Stretch headers to fit
         header = self.ui.qtable_avoids.horizontalHeader()
@@ -129,30 +270,21 @@ class UIMain(QMainWindow):
 
     @error_handler
     def filter_avoids_table(self, val):
-        """ Filter current avoids_df using string values in lineedit.
+        """ Filter the avoids table to rows containing the string value in lineedit.
             This is called on lineedit_filter_avoids value change
         """
 
-        filtered_table = self.avoids_df.copy()
+        ### Nothing to filter until avoids are loaded
+        if self.avoids_search is None:
+            return
+
         filter_text = self.ui.lineedit_filter_avoids.text().strip()
 
-        ### If no value, set back to full df
+        ### If no value, show every row again
         if filter_text == '':
-            self.set_avoids_table_data()
-
-        # Can configure whether the filter works only on value or on all fields
-        if self.config.get('FILTER_AVOIDS_ON_VALUE_ONLY', '0') == '1':
-            filtered_table = filtered_table[filtered_table[c.VALUE_FIELD].str.contains(filter_text)]
+            self.ui.qtable_avoids.model().set_row_filter(None)
         else:
-            filtered_table = filtered_table[
-                (filtered_table[c.VALUE_FIELD].str.contains(filter_text, case=False)) |
-                (filtered_table[c.TYPE_FIELD].str.contains(filter_text, case=False)) |
-                (filtered_table[c.DESCRIPTION_FIELD].str.contains(filter_text, case=False)) |
-                (filtered_table[c.CATEGORY_FIELD].str.contains(filter_text, case=False))
-                ]
-
-        ### Set filtered table
-        self.set_filtered_avoids_table_data(filtered_table)
+            self.ui.qtable_avoids.model().set_row_filter(self.avoids_search.search(filter_text))
 
     @error_handler
     def set_results_table_data(self):
@@ -162,20 +294,45 @@ class UIMain(QMainWindow):
         if self.results_df is None:
             return
 
+        import pandas as pd
+
         ### Show no conflicts if no conflicts found
         if self.results_df.empty:
             self.results_df = pd.DataFrame.from_dict({'Results': ['No Conflicts!']})
 
-        ### Qtable uses custom pandas model
-        self.ui.qtable_results.setModel(QTPandasModel(self.results_df))
+        with Timer(None, STAGE_TABLE_RENDER, METRICS):
+            self.set_results_table_model(LazyPandasModel(self.results_df, fetch_size=c.RESULTS_FETCH_SIZE))
+
+    def set_results_table_model(self, model):
+        """ Set the model for qtable_results, sized to fit. """
+
+        ### Qtable uses custom pandas model, rows are fetched in batches as the table scrolls
+        self.ui.qtable_results.setModel(model)
 
         ### Stretch headers to fit
         header = self.ui.qtable_results.horizontalHeader()
         header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
 
-        ### Set rows to fit to content
-        rows = self.ui.qtable_results.verticalHeader()
-        rows.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+        ### Fit rows to content as they come into view, ResizeToContents would measure every row up front
+        model.rowsInserted.connect(self.resize_visible_result_rows)
+        model.layoutChanged.connect(self.resize_visible_result_rows)
+        model.modelReset.connect(self.resize_visible_result_rows)
+        self.resize_visible_result_rows()
+
+    def resize_visible_result_rows(self, *args):
+        """ Fit the height of rows in view of qtable_results to their content. """
+
+        table = self.ui.qtable_results
+        if table.model() is None:
+            return
+
+        ### Top to bottom, each resize can change which rows are left in view
+        row = max(table.rowAt(0), 0)
+        while row < table.model().rowCount():
+            table.resizeRowToContents(row)
+            if table.rowViewportPosition(row) + table.rowHeight(row) >= table.viewport().height():
+                break
+            row += 1
 
     @error_handler
     def get_and_strip_names(self):
@@ -186,10 +343,16 @@ class UIMain(QMainWindow):
 
     @error_handler
     def check_names(self, val):
-        """ Take entered names and check against full list of all avoids. """
+        """ Take entered names and check against full list of all avoids.
+            The check runs on a ScreenWorker thread and results fill in as names are screened.
+        """
 
-        ### Show process is busy with cursor change
-        self.setCursor(QtGui.QCursor(self.busy_cursor))
+        ### Only one check at a time, and not while avoids are loading
+        if self.screen_thread is not None or self.avoids_thread is not None:
+            return
+
+        if self.avoid_index is None:
+            raise UserError("No avoids loaded!\nPlease check the master avoids file and reload")
 
         ### Get al names, get any ignore strings entered, get all checked categories
         self.get_and_strip_names()
@@ -204,19 +367,318 @@ class UIMain(QMainWindow):
         if all([i is False for i in self.checked_categories.values()]):
             raise UserError("No avoids checked!")
 
-        ### Run main avoids check function
-        self.results_df = check_names_for_avoids(
+        ### Run main avoids check on a worker thread
+        worker = ScreenWorker(
             self.names_list,
             self.ignore_list,
-            self.avoids_df,
+            self.avoid_index,
+            self.checked_categories,
+            cache=self.hits_cache,
+            pool=self.get_screen_pool(),
+            )
+        self.start_screen_worker(worker, self.finish_check_names)
+
+    @error_handler
+    def check_names_file(self, val):
+        """ Check every name in a text, CSV or Excel file against the checked avoids, for lists too big for text_names.
+            Names are read and screened a chunk at a time on a FileScreenWorker thread, every conflict is written
+            to a results file and only the first are shown in qtable_results.
+        """
+
+        ### Only one check at a time, and not while avoids are loading
+        if self.screen_thread is not None or self.avoids_thread is not None:
+            return
+
+        if self.avoid_index is None:
+            raise UserError("No avoids loaded!\nPlease check the master avoids file and reload")
+
+        self.read_stem_ignores()
+        self.read_checkboxes()
+        if all([i is False for i in self.checked_categories.values()]):
+            raise UserError("No avoids checked!")
+
+        names_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Screen names file', '', 'Names (*.txt *.csv *.xlsx);;All files (*)')
+        if not names_path:
+            return
+
+        default_path = f"{os.path.splitext(names_path)[0]}_conflicts.csv"
+        results_path, per_hit = self.get_results_save_path('Save conflicts to', default_path)
+        if not results_path:
+            return
+
+        if os.path.abspath(results_path) == os.path.abspath(names_path):
+            raise UserError("Conflicts can't be saved over the names file!")
+
+        self.ui.qtable_results.reset()
+        worker = FileScreenWorker(
+            names_path,
+            results_path,
+            self.ignore_list,
+            self.avoid_index,
             self.checked_categories,
+            cache=self.hits_cache,
+            pool=self.get_screen_pool(),
+            per_hit=per_hit,
             )
+        self.start_screen_worker(worker, self.finish_check_names_file)
+
+    def get_results_save_path(self, title, default_path):
+        """ Ask where to save results, returns (path, per_hit) with per_hit True for a row per conflict, path None if cancelled.
+            The extension of the chosen filter is added if the path has none of a results format.
+        """
+
+        from src.utils.result_writers import get_result_format
+
+        filters = list(c.RESULTS_FILE_FILTERS)
+        initial_filter = next((i for i in filters if c.RESULTS_FILE_FILTERS[i][0] == get_result_format(default_path)), filters[0])
+        results_path, selected_filter = QtWidgets.QFileDialog.getSaveFileName(self, title, default_path, ';;'.join(filters), initial_filter)
+        if not results_path:
+            return None, False
+
+        out_format, per_hit = c.RESULTS_FILE_FILTERS.get(selected_filter, (None, False))
+        if out_format is not None and get_result_format(results_path, default=None) is None:
+            results_path = f'{results_path}.{out_format}'
+
+        return results_path, per_hit
+
+    def get_screen_pool(self):
+        """ Returns the ScreenPool shared by every check, its worker processes start with the first check large enough to shard
+            and are kept until the avoids change, see finish_avoids_load.
+        """
+
+        if self.screen_pool is None:
+            from src.utils.check_names import ScreenPool
+            self.screen_pool = ScreenPool()
+        return self.screen_pool
+
+    def start_screen_worker(self, worker, finished):
+        """ Start a screen worker on its thread, with finished connected to its finished signal. """
+
+        import pandas as pd
+
+        ### Start from an empty table with every checked category, rows are appended as they are found
+        self.results_df = None
+        self.results_file = None
+        checked_cols = [i for i in self.checked_categories if self.checked_categories[i] is True]
+        self.set_results_table_model(LazyPandasModel(pd.DataFrame(columns=[c.NAME_FIELD] + checked_cols), fetch_size=c.RESULTS_FETCH_SIZE))
+
+        self.screen_worker = worker
+        self.screen_worker.progress.connect(self.update_check_progress)
+        self.screen_worker.partial_results.connect(self.add_partial_results)
+        self.screen_worker.finished.connect(finished)
+        self.screen_worker.failed.connect(self.fail_check_names)
+
+        self.screen_thread = self.start_worker_thread(self.screen_worker)
+        self.set_check_running(True)
+
+    @error_handler
+    def cancel_check_names(self, val):
+        """ Stop the running check, conflicts found so far are kept. """
+
+        if self.screen_worker is not None:
+            self.screen_worker.cancel()
+            self.ui.statusbar.showMessage('Cancelling...')
+
+    @error_handler
+    def update_check_progress(self, done, total, eta):
+        """ Show names checked so far and estimated time left, or just names checked if the total is not known (0). """
+
+        ### A maximum of 0 shows a busy bar
+        self.progress_check.setMaximum(total)
+        self.progress_check.setValue(done)
+        if total:
+            self.ui.statusbar.showMessage(f'Checked {done:,} of {total:,} names, about {eta:,.0f}s left')
+        else:
+            self.ui.statusbar.showMessage(f'Checked {done:,} names')
+
+    @error_handler
+    def add_partial_results(self, df):
+        """ Append conflicts found so far to qtable_results while the check runs. """
+
+        with Timer(None, STAGE_TABLE_RENDER, METRICS):
+            self.ui.qtable_results.model().append_rows(df)
+
+    @error_handler
+    def finish_check_names(self, results_df, cancelled):
+        """ Show the final results once the worker is done. """
+
+        ### Kept for carrying results over to the next avoids change, if screened against the current avoids
+        session = self.screen_worker.session
+        self.screen_session = session if session is not None and session.avoid_index is self.avoid_index else None
+
+        self.stop_screen_thread()
+        self.results_df = results_df
 
         ### Set new results data table
         self.set_results_table_data()
 
-        ### Reset cursor when process is complete
-        self.setCursor(QtGui.QCursor(self.default_cursor))
+        if cancelled:
+            self.ui.statusbar.showMessage('Check cancelled, showing conflicts for the names checked so far')
+        else:
+            self.ui.statusbar.showMessage(f'Checked {len(self.names_list):,} names', 5000)
+
+        report_run(self.logger, self.config, 'check_names', {
+            'names':        len(self.names_list),
+            'avoids':       len(self.avoid_index),
+            'conflicts':    len(results_df),
+            'cancelled':    cancelled,
+            })
+
+    @error_handler
+    def finish_check_names_file(self, results_df, cancelled):
+        """ Show the first conflicts of a names file check once the worker is done. """
+
+        ### Names of a file check aren't kept, so there is no session to carry over to the next avoids change
+        worker = self.screen_worker
+        self.screen_session = None
+
+        self.stop_screen_thread()
+        self.results_df = results_df
+        self.set_results_table_data()
+
+        ### Exports read every conflict back from the results file, if there are more than the table shows
+        if worker.conflicts > len(results_df):
+            self.results_file = (worker.results_path, worker.per_hit)
+
+        shown = f', first {len(results_df):,} shown' if worker.conflicts > len(results_df) else ''
+        message = f'{worker.screened:,} names, {worker.conflicts:,} with conflicts saved to {worker.results_path}{shown}'
+        if cancelled:
+            self.ui.statusbar.showMessage(f'Check cancelled after {message}')
+        else:
+            self.ui.statusbar.showMessage(f'Checked {message}')
+
+        report_run(self.logger, self.config, 'check_names_file', {
+            'names':        worker.screened,
+            'avoids':       len(self.avoid_index),
+            'conflicts':    worker.conflicts,
+            'cancelled':    cancelled,
+            })
+
+    def fail_check_names(self, err, tb):
+        """ Route an error raised on the worker thread to the usual dialogues. """
+
+        self.stop_screen_thread()
+        self.ui.statusbar.clearMessage()
+        self.show_worker_error(err, tb)
+
+    def stop_screen_thread(self):
+        """ Wait for the worker thread to wind down and reset the check controls. """
+
+        if self.screen_thread is not None:
+            self.stop_worker_thread(self.screen_thread)
+            self.screen_thread = None
+            self.screen_worker = None
+
+        self.set_check_running(False)
+
+    def set_check_running(self, running):
+        """ Toggle controls and cursor between a running and an idle check. """
+
+        self.ui.btn_check_names.setEnabled(not running and self.avoids_thread is None)
+        self.ui.btn_names_file.setEnabled(not running and self.avoids_thread is None)
+        self.ui.btn_export_results.setEnabled(not running and self.export_thread is None)
+        self.ui.btn_cancel_check.setEnabled(running)
+        self.progress_check.setVisible(running)
+        if running:
+            self.progress_check.setValue(0)
+
+        ### Show process is busy with cursor change
+        self.setCursor(QtGui.QCursor(self.busy_cursor if running else self.default_cursor))
+
+    @error_handler
+    def export_results(self, val):
+        """ Write the conflicts of the last check to an Excel, CSV or JSON lines file on a worker thread.
+            Rows are streamed from results_df, or from the results file of a names file check with more conflicts
+            than the table shows, so the export takes no more memory than the results already do.
+        """
+
+        ### Only one export at a time, and not while a check is still adding results
+        if self.export_thread is not None or self.screen_thread is not None:
+            return
+
+        if self.results_df is None or c.NAME_FIELD not in self.results_df.columns:
+            raise UserError("No conflicts to export!")
+
+        if self.results_file is not None and self.results_file[1]:
+            raise UserError(f"Every conflict of the last check is already saved to {self.results_file[0]}")
+
+        results_path, per_hit = self.get_results_save_path('Export results to', 'conflicts.xlsx')
+        if not results_path:
+            return
+
+        from src.utils.result_writers import iter_df_results, read_results_file, write_results
+
+        if self.results_file is not None:
+            if os.path.abspath(results_path) == os.path.abspath(self.results_file[0]):
+                raise UserError("Results can't be exported over the file they are read from!")
+            categories, results = read_results_file(self.results_file[0])
+        else:
+            categories = [i for i in self.results_df.columns if i != c.NAME_FIELD]
+            results = iter_df_results(self.results_df)
+
+        self.export_worker = FunctionWorker(write_results, results_path, categories, results, per_hit=per_hit)
+        self.export_worker.finished.connect(self.finish_export_results)
+        self.export_worker.failed.connect(self.fail_export_results)
+
+        self.export_thread = self.start_worker_thread(self.export_worker)
+        self.set_exporting(True)
+
+    @error_handler
+    def finish_export_results(self, written):
+        """ Show where the results went once the export is done. """
+
+        results_path = self.export_worker.args[0]
+        self.stop_export_thread()
+
+        self.logger.info(f'Exported {written} names to {results_path}')
+        self.ui.statusbar.showMessage(f'Exported {written:,} names to {results_path}', 5000)
+
+    def fail_export_results(self, err, tb):
+        """ Route an error raised while exporting to the usual dialogues. """
+
+        self.stop_export_thread()
+        self.ui.statusbar.clearMessage()
+        self.show_worker_error(err, tb)
+
+    def stop_export_thread(self):
+        """ Wait for the export thread to wind down and enable Export Results again. """
+
+        if self.export_thread is not None:
+            self.stop_worker_thread(self.export_thread)
+            self.export_thread = None
+            self.export_worker = None
+
+        self.set_exporting(False)
+
+    def set_exporting(self, exporting):
+        """ Toggle Export Results between a running and an idle export. """
+
+        self.ui.btn_export_results.setEnabled(not exporting and self.screen_thread is None)
+        if exporting:
+            self.ui.statusbar.showMessage('Exporting results...')
+
+    def start_worker_thread(self, worker):
+        """ Move a worker onto a new QThread and start it running, returns the thread. """
+
+        thread = QtCore.QThread(self)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        thread.start()
+        return thread
+
+    def stop_worker_thread(self, thread):
+        """ Stop a worker's thread once its run has returned. """
+
+        thread.quit()
+        thread.wait()
+
+    def show_worker_error(self, err, tb):
+        """ Show an error raised on a worker thread, as error_handler would on the GUI thread. """
+
+        if isinstance(err, UserError):
+            self.raise_error(err)
+        else:
+            QMessageBox.critical(self, 'An unexpected error occurred', tb)
 
     @error_handler
     def read_stem_ignores(self):
@@ -284,6 +746,8 @@ class UIMain(QMainWindow):
             QMessageBox.Yes | QMessageBox.No)
 
         if choice == QMessageBox.Yes :
+            from src.utils.get_avoids_data import save_project_competitor_to_file
+
             self.ui.text_project_avoids.clear()
             self.ui.text_competitor.clear()
             self.ui.text_internal_names.clear()
@@ -297,28 +761,10 @@ class UIMain(QMainWindow):
 
         self.set_avoids_table_data()
 
-    @error_handler
-    def save_project_competitor_avoids_start(self):
-        """ Parse and save user-defined project/competitor avoids from previous session. """
-
-        project_avoids_text = self.ui.text_project_avoids.toPlainText()
-        competitor_avoids_text = self.ui.text_competitor.toPlainText()
-        internal_names_text = self.ui.text_internal_names.toPlainText()
-
-        ### No action if nothing exists
-        if project_avoids_text == '' and competitor_avoids_text == '' and internal_names_text == '':
-            return
-
-        ### Save avoids in config file
-        save_project_competitor_to_file(self.config, project_avoids_text, competitor_avoids_text, internal_names_text)
-
-        ### Parse avoids and concat to complete avoids df
-        addtl_avoids_df = parse_project_competitor_avoids(project_avoids_text, competitor_avoids_text, internal_names_text)
-        self.set_avoids_table_data(addtl_avoids_df)
-
     @error_handler
     def save_project_competitor_avoids(self, val):
         """ Parse and save user-defined project/competitor avoids from current session. """
+        from src.utils.get_avoids_data import parse_project_competitor_avoids, save_project_competitor_to_file
 
         project_avoids_text = self.ui.text_project_avoids.toPlainText()
         competitor_avoids_text = self.ui.text_competitor.toPlainText()
@@ -335,15 +781,6 @@ class UIMain(QMainWindow):
         addtl_avoids_df = parse_project_competitor_avoids(project_avoids_text, competitor_avoids_text, internal_names_text)
         self.set_avoids_table_data(addtl_avoids_df)
 
-    @error_handler
-    def set_project_competitor_avoids_from_file(self):
-        """ Set text area contents for existing project/competitor avoids. """
-
-        proj_text, comp_text, intr_text = read_project_competitor_from_file(self.config)
-        self.ui.text_project_avoids.setPlainText(proj_text)
-        self.ui.text_competitor.setPlainText(comp_text)
-        self.ui.text_internal_names.setPlainText(intr_text)
-
     def raise_error(self, err):
         """ Raise error in a dialogue box. """
         self.err_dialogue.setWindowTitle('NameEvaluator Warning')
@@ -415,6 +852,20 @@ class UIMain(QMainWindow):
             choice = QMessageBox.question(self, "Quit", "Leave?", QMessageBox.Yes | QMessageBox.No)
 
         if choice == QMessageBox.Yes :
+            ### Let a running check stop before the window goes
+            if self.screen_worker is not None:
+                self.screen_worker.cancel()
+                self.stop_screen_thread()
+            if self.avoids_thread is not None:
+                self.stop_avoids_thread()
+            if self.export_thread is not None:
+                self.stop_export_thread()
+            if self.screen_pool is not None:
+                self.screen_pool.shutdown()
+            if self.history is not None:
+                self.history.close()
+            if TRACER.enabled:
+                TRACER.log_summary(self.logger)
             QMainWindow.closeEvent(self, event)
         else :
             event.ignore()
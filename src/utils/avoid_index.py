@@ -0,0 +1,300 @@
+import hashlib
+from collections import namedtuple
+from functools import partial
+from time import perf_counter
+
+import src.utils.constants as c
+from src.utils.common_utils import Timer
+from src.utils.matchers import AhoCorasick, SuffixAutomaton, Trie
+from src.utils.metrics import METRICS, STAGE_IGNORE_FILTER, STAGE_STRING_COMPARE, match_stage
+
+
+### Bump when a change to matching changes the hits found against the same avoids, hits saved by older versions are then not reused
+MATCH_ENGINE_VERSION = 2
+
+
+def check_prefix(name, avoid):
+    """ True if name starts with avoid. """
+    return name.lower().startswith(avoid.lower())
+
+
+def check_infix(name, avoid):
+    """ True if avoid exists within the name (excluding first/last letter), matched case-sensitively. """
+    return avoid in name[1:-1]
+
+
+def check_suffix(name, avoid):
+    """ True if name ends with avoid. """
+    return name.lower().endswith(avoid.lower())
+
+
+def check_anywhere(name, avoid):
+    """ True if the avoid is anywhere in the name. """
+    return avoid.lower() in name.lower()
+
+
+def check_string_compare(name, avoid):
+    """ True if the name matches or is contained within the avoid. """
+    return name.lower() in avoid.lower()
+
+
+### Functions mapped to a type
+TYPE_CHECK_FUNCS = {
+    c.PREFIX:               check_prefix,
+    c.INFIX:                check_infix,
+    c.SUFFIX:               check_suffix,
+    c.ANYWHERE:             check_anywhere,
+    c.NAME_MATCH:           check_string_compare,
+}
+
+### Compiled matcher builders per type, used in place of the type's TYPE_CHECK_FUNCS entry
+# Each builder takes (row position, lower-cased value) pairs and must give the same hits as the check function,
+# types in CASE_SENSITIVE_TYPES get their values and names as entered instead
+TYPE_MATCHER_BUILDERS = {
+    c.PREFIX:               Trie,
+    c.INFIX:                AhoCorasick,
+    c.SUFFIX:               partial(Trie, reverse=True),
+    c.ANYWHERE:             AhoCorasick,
+}
+
+### Types whose check function compares case, as infix always has
+CASE_SENSITIVE_TYPES = (c.INFIX,)
+
+### Stage timing the types checked one avoid at a time
+STAGE_PER_AVOID = match_stage('per_avoid')
+
+
+### A single avoid found in a name
+# position: avoid row in the AvoidIndex, match: avoid type or string_compare match kind
+# offset/length: where the match sits in the name, None where it has no single location
+Hit = namedtuple('Hit', ['position', 'match', 'offset', 'length'])
+
+### string_compare match kinds, listed after every other hit
+STRING_COMPARE_MATCHES = (c.STRING_MATCH, c.STRING_COMPARE_COMBO, c.N_LETTERS)
+
+
+def hit_order(hit):
+    """ Sort key putting hits in find_hits order, other hits then string_compare hits, each by row. """
+    return hit.match in STRING_COMPARE_MATCHES, hit.position
+
+
+def combo_key(value):
+    """ Key of a string_compare combo hit, first letter and last 3 letters. """
+    value = value.lower()
+    return value[0], value[-3:]
+
+
+class AvoidIndex:
+    """ Compiled, read-only index over an avoids dataframe.
+        Normalized values, type partitions, category codes and matchers are built once per avoids change,
+        every check then reuses them. Rows are addressed by position, after de-duplication.
+    """
+
+    def __init__(self, avoids_df):
+        avoids_df = avoids_df.drop_duplicates().reset_index(drop=True)
+        self._build(tuple(avoids_df[c.VALUE_FIELD]), tuple(avoids_df[c.TYPE_FIELD]), tuple(avoids_df[c.CATEGORY_FIELD]))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Build an index from (value, type, category) rows, without a dataframe. """
+
+        index = cls.__new__(cls)
+        values, types, categories = (tuple(col) for col in zip(*rows)) if rows else ((), (), ())
+        index._build(values, types, categories)
+        return index
+
+    def subset(self, positions):
+        """ Returns an AvoidIndex of only the avoids at positions, its row i being row positions[i] of this index. """
+        return AvoidIndex.from_rows([self.keys[pos] for pos in positions])
+
+    def _build(self, values, types, categories):
+        """ Compile the index from its columns. """
+
+        self.values = values
+        self.normalized = tuple(v.lower() for v in self.values)
+        self.types = types
+        self.categories = categories
+        self.string_compare_minimum = c.STRING_COMPARE_MINIMUM
+
+        ### Display string of every hit whose match is its avoid's type, only string_compare labels depend on the name
+        self._type_labels = tuple(f'{v} ({t})' for v, t in zip(self.values, self.types))
+
+        ### (value, type, category) per row, identifies an avoid across indexes
+        self.keys = tuple(zip(self.values, self.types, self.categories))
+
+        ### Content hash of the avoids in row order and the matching settings,
+        # hits found against one index are valid for any index of the same version
+        version = hashlib.sha1(f'{MATCH_ENGINE_VERSION}\x1f{self.string_compare_minimum}\x1e'.encode('utf-8'))
+        for key in self.keys:
+            version.update('\x1f'.join(key).encode('utf-8') + b'\x1e')
+        self.version = version.hexdigest()
+
+        ### Category codes, so per-check category filtering is a lookup rather than string compares
+        self.category_names = tuple(dict.fromkeys(self.categories))
+        codes = {cat: i for i, cat in enumerate(self.category_names)}
+        self.category_codes = tuple(codes[cat] for cat in self.categories)
+
+        ### Row positions per avoid type
+        type_positions = {}
+        for pos, avoid_type in enumerate(self.types):
+            type_positions.setdefault(avoid_type, []).append(pos)
+        self.type_positions = {t: tuple(p) for t, p in type_positions.items()}
+
+        ### Types without a compiled matcher are checked one avoid at a time with TYPE_CHECK_FUNCS
+        self._func_positions = tuple(
+            pos for pos, t in enumerate(self.types) if t not in TYPE_MATCHER_BUILDERS and t != c.STRING_COMPARE
+            )
+
+        ### Types without avoids get no matcher, small indexes (e.g. a handful of added avoids) then skip them outright
+        self._matchers = {
+            avoid_type: builder(self._typed_values(avoid_type, normalized=avoid_type not in CASE_SENSITIVE_TYPES))
+            for avoid_type, builder in TYPE_MATCHER_BUILDERS.items() if avoid_type in self.type_positions
+            }
+        self._stages = {avoid_type: match_stage(avoid_type) for avoid_type in self._matchers}
+
+        ### Only states of at least STRING_COMPARE_MINIMUM letters carry avoid positions,
+        # so the automaton doubles as the k-gram index of which avoids share a substring with a name
+        self._string_compare = SuffixAutomaton(self._typed_values(c.STRING_COMPARE), self.string_compare_minimum)
+
+        combos = {}
+        for pos, val in self._typed_values(c.STRING_COMPARE):
+            if val:
+                combos.setdefault(combo_key(val), []).append(pos)
+        self._combos = combos
+
+        self._allowed_cache = {}
+
+    def __len__(self):
+        """ Returns number of avoids in the index. """
+        return len(self.values)
+
+    def _typed_values(self, avoid_type, normalized=True):
+        """ Returns (position, normalized value) pairs for a single avoid type, values as entered if not normalized. """
+
+        values = self.normalized if normalized else self.values
+        return [(pos, values[pos]) for pos in self.type_positions.get(avoid_type, ())]
+
+    def allowed_mask(self, checked_categories, ignore_list):
+        """ Returns bytearray with 1 for every avoid in a checked category and not contained in any ignore string.
+            Cached per (categories, ignore list), as these only change between checks.
+        """
+
+        key = (tuple(sorted(checked_categories)), tuple(ignore_list))
+        if key in self._allowed_cache:
+            return self._allowed_cache[key]
+
+        with Timer(None, STAGE_IGNORE_FILTER, METRICS):
+            checked_codes = {i for i, cat in enumerate(self.category_names) if cat in checked_categories}
+            ignored_values = {v for v in set(self.values) if any(v in i for i in ignore_list)}
+
+            mask = bytearray(
+                code in checked_codes and val not in ignored_values
+                for code, val in zip(self.category_codes, self.values)
+                )
+
+        self._allowed_cache[key] = mask
+        return mask
+
+    def find_hits(self, name, allowed, timings=None):
+        """ Returns list of Hit for every allowed avoid found in name.
+            Non-string_compare hits come first, each group in row order.
+            With a timings dict, seconds spent per matching stage are added to it, see metrics.match_stage.
+        """
+
+        lname = name.lower()
+        start = perf_counter() if timings is not None else 0
+
+        ### Prefix/infix/suffix/anywhere hits come from the compiled matchers
+        found = {}
+        for avoid_type, matcher in self._matchers.items():
+            text = name if avoid_type in CASE_SENSITIVE_TYPES else lname
+
+            ### Infix avoids exclude the first/last letter, so shift offsets back onto the full name
+            text, shift = (text[1:-1], 1) if avoid_type == c.INFIX else (text, 0)
+            for pos, offset in matcher.first_matches(text).items():
+                if allowed[pos]:
+                    found[pos] = offset + shift
+
+            if timings is not None:
+                start = _add_time(timings, self._stages[avoid_type], start)
+
+        ### Remaining types are checked per avoid
+        for pos in self._func_positions:
+            if allowed[pos] and TYPE_CHECK_FUNCS[self.types[pos]](name, self.values[pos]):
+                found[pos] = None
+
+        hits = [
+            Hit(pos, self.types[pos], offset, None if offset is None else len(self.values[pos]))
+            for pos, offset in sorted(found.items())
+            ]
+
+        if timings is not None:
+            start = _add_time(timings, STAGE_PER_AVOID, start)
+
+        if c.STRING_COMPARE in self.type_positions:
+            hits.extend(self._find_string_compare_hits(lname, allowed))
+            if timings is not None:
+                _add_time(timings, STAGE_STRING_COMPARE, start)
+        return hits
+
+    def _find_string_compare_hits(self, lname, allowed):
+        """ Yield Hit for string_compare avoids, in row order.
+            Each avoid gives at most one of: string match, combo, or its longest shared substring.
+        """
+
+        ### Longest substring shared with every string_compare avoid, from a single pass over the name
+        shared = self._string_compare.longest_matches(lname)
+
+        ### Only avoids sharing a substring or the combo key with the name can hit
+        # a string match needs the whole name in the avoid, so names shorter than the minimum check every avoid
+        if len(lname) >= self.string_compare_minimum:
+            candidates = sorted(set(shared).union(self._combos.get(combo_key(lname), ())))
+        else:
+            candidates = self.type_positions.get(c.STRING_COMPARE, ())
+
+        for pos in candidates:
+            if not allowed[pos]:
+                continue
+
+            val = self.normalized[pos]
+
+            ### For simple compare, does the name match or is it contained in the avoid
+            if lname in val:
+                yield Hit(pos, c.STRING_MATCH, 0, len(lname))
+            ### Do the name and avoid share the same 1st and final 3 letters
+            elif val and combo_key(val) == combo_key(lname):
+                yield Hit(pos, c.STRING_COMPARE_COMBO, None, None)
+            ### Do the name and avoid share any substring of n letters
+            # n is the longest shared length, at least STRING_COMPARE_MINIMUM defined in config
+            elif pos in shared:
+                yield Hit(pos, c.N_LETTERS, *shared[pos])
+
+    def hit_label(self, name, hit):
+        """ Returns the display string for a hit, e.g. 'vir (suffix)' or 'daxorel (*dax*)'. """
+
+        if hit.match == self.types[hit.position]:
+            return self._type_labels[hit.position]
+        return format_hit_label(name, self.values[hit.position], hit)
+
+
+def _add_time(timings, stage, start):
+    """ Add the seconds since start to a stage in timings, returns the current time as the next stage's start. """
+
+    now = perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+
+def format_hit_label(name, value, hit):
+    """ Returns the display string for a hit of the avoid value in name. """
+
+    if hit.match == c.STRING_MATCH:
+        marker = 'string match'
+    elif hit.match == c.STRING_COMPARE_COMBO:
+        marker = f'{name[0]}--{name[-3:]}'
+    elif hit.match == c.N_LETTERS:
+        marker = f'*{name.lower()[hit.offset:hit.offset+hit.length]}*'
+    else:
+        marker = hit.match
+
+    return f'{value} ({marker})'
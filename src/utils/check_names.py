@@ -1,160 +1,429 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
+from itertools import islice, repeat
+from operator import itemgetter
+from time import perf_counter
 
-import pandas as pd
 import numpy as np
-from src.utils.common_utils import error_handler
+import pandas as pd
+from src.utils.common_utils import Timer, error_handler
 
 import src.utils.constants as c
+from src.utils.avoid_index import STRING_COMPARE_MATCHES, AvoidIndex, Hit, hit_order
+from src.utils.metrics import METRICS, STAGE_BUILD_INDEX, STAGE_RESULT_ASSEMBLY, Histogram
+
+
+class ResultsBuilder:
+    """ Collects hits as plain per-category lists of cell strings.
+        The results dataframe is only built once, in to_df, rather than concatenated per name.
+        Time spent building rows is added up and recorded as the result_assembly stage by to_df.
+    """
+
+    def __init__(self, avoid_index, checked_avoid_categories):
+        self.avoid_index = avoid_index
+        self.categories = list(checked_avoid_categories)
+        self.names = []
+        self.cells = {cat: [] for cat in self.categories}
+        self.seconds = 0.0
+
+    def __len__(self):
+        """ Returns number of names with at least one hit. """
+        return len(self.names)
+
+    def add(self, name, hits):
+        """ Add a name's hits as one row, names without hits are left out. Returns True if a row was added. """
+
+        if not hits:
+            return False
+
+        start = perf_counter()
+
+        ### Each category cell lists its hits one per line, e.g. 'vir (suffix)'
+        lines = group_hit_labels(self.avoid_index, name, hits)
+
+        self.names.append(name)
+        for cat in self.categories:
+            self.cells[cat].append('\n'.join(lines.get(cat, ())))
+
+        self.seconds += perf_counter() - start
+        return True
+
+    def rows_df(self, start=0):
+        """ Returns rows from start onwards with a column for every checked category, used for partial results. """
+
+        data = {c.NAME_FIELD: self.names[start:]}
+        for cat in self.categories:
+            data[cat] = self.cells[cat][start:]
+
+        return pd.DataFrame(data)
+
+    def to_df(self):
+        """ Returns the results dataframe, Name plus a column for each checked category with any hits. """
+
+        start = perf_counter()
+
+        data = {c.NAME_FIELD: self.names}
+        for cat in self.categories:
+            if any(self.cells[cat]):
+                data[cat] = self.cells[cat]
+        df = pd.DataFrame(data)
+
+        METRICS.add_stage_time(STAGE_RESULT_ASSEMBLY, self.seconds + perf_counter() - start)
+        self.seconds = 0.0
+        return df
+
+
+class ScreenSession:
+    """ Names and hits of a completed screen, kept so a change of avoids can be applied as a delta.
+        Only avoids added by the change are screened, hits for removed avoids are dropped.
+    """
+
+    def __init__(self, avoid_index, checked_avoid_categories, ignore_list):
+        self.avoid_index = avoid_index
+        self.categories = list(checked_avoid_categories)
+        self.ignore_list = list(ignore_list)
+        self.names = []
+        self.hits = []
+
+    def __len__(self):
+        """ Returns number of names screened. """
+        return len(self.names)
+
+    def add(self, name, hits):
+        """ Record a screened name and its hits. """
+        self.names.append(name)
+        self.hits.append(hits)
+
+    def rebase(self, avoid_index, workers=None):
+        """ Returns a ScreenSession of the same names against a new AvoidIndex, this session is left as is.
+            Avoids are matched across the indexes on (value, type, category).
+        """
+
+        ### Old row position: new row position, None for removed avoids
+        new_positions = {key: pos for pos, key in enumerate(avoid_index.keys)}
+        moved = [new_positions.get(key) for key in self.avoid_index.keys]
+        old_keys = set(self.avoid_index.keys)
+        added = [pos for pos, key in enumerate(avoid_index.keys) if key not in old_keys]
+
+        session = ScreenSession(avoid_index, self.categories, self.ignore_list)
+        session.names = self.names
+        if moved == list(range(len(moved))):
+            session.hits = [list(hits) for hits in self.hits]
+        else:
+            session.hits = [
+                [Hit(moved[hit.position], *hit[1:]) for hit in hits if moved[hit.position] is not None]
+                for hits in self.hits
+                ]
+
+        ### Kept avoids in the same relative order keep their hits in order, otherwise every name is re-sorted
+        kept = [pos for pos in moved if pos is not None]
+        resort = [i for i, hits in enumerate(session.hits) if hits] if kept != sorted(kept) else []
+
+        ### Screen every name against the added avoids only, hits are moved onto the new index rows
+        delta_index = avoid_index.subset(added)
+        allowed = delta_index.allowed_mask(self.categories, self.ignore_list)
+        if any(allowed):
+            names = screen_names(self.names, delta_index, allowed, workers)
+            for i, (hits, (name, delta_hits)) in enumerate(zip(session.hits, names)):
+                if delta_hits:
+                    hits.extend(Hit(added[hit.position], *hit[1:]) for hit in delta_hits)
+                    resort.append(i)
 
+        ### Keep hits in the order a full screen would give them
+        for i in set(resort):
+            session.hits[i].sort(key=hit_order)
 
-def setup_base_results_df(names_list, checked_avoid_categories):
-    """ Set up the base results Dataframe which will be built upon by further processes. """
+        return session
 
-    results_df = pd.DataFrame.from_dict({c.NAME_FIELD:[]})
+    def to_df(self):
+        """ Returns the results dataframe, as check_names_for_avoids. """
 
-    for cat in checked_avoid_categories:
-        results_df[cat] = ''
+        results = ResultsBuilder(self.avoid_index, self.categories)
+        for name, hits in zip(self.names, self.hits):
+            results.add(name, hits)
+        return results.to_df()
 
-    return results_df
+    def fill_cache(self, cache):
+        """ Store every name's hits in a hits cache, see screen_names. """
+
+        cache_key = hits_cache_key(self.avoid_index, self.categories, self.ignore_list)
+        for name, hits in zip(self.names, self.hits):
+            cache.put((name,) + cache_key, hits)
+        cache.flush()
+
+
+class LabeledHits(list):
+    """ List of a name's Hits along with their labels, as group_hit_labels returns them, formatted by a ScreenPool worker. """
+
+    __slots__ = ('labels',)
+
+
+def group_hit_labels(avoid_index, name, hits):
+    """ Returns dict of category: list of hit display strings, in hit order. """
+
+    if isinstance(hits, LabeledHits):
+        return hits.labels
+
+    categories = avoid_index.categories
+    labels = {}
+    for hit in hits:
+        labels.setdefault(categories[hit.position], []).append(avoid_index.hit_label(name, hit))
+
+    return labels
 
 
 @error_handler
-def check_names_for_avoids(names_list, ignore_list, avoids_df, checked_avoids):
-    """ Primary check_names controller function. """
+def check_names_for_avoids(names_list, ignore_list, avoids, checked_avoids, workers=None, cache=None):
+    """ Primary check_names controller function.
+        avoids is expected to be an AvoidIndex built when the avoids last changed,
+        an avoids dataframe is also accepted and indexed here.
+        workers defaults to SCREEN_WORKERS from the config, cache is an optional LRUCache of hits, see screen_names.
+    """
+
+    if isinstance(avoids, AvoidIndex):
+        avoid_index = avoids
+    else:
+        with Timer(None, STAGE_BUILD_INDEX, METRICS):
+            avoid_index = AvoidIndex(avoids)
 
     ### Get all categories which have been 'checked'
     checked_avoid_categories = [i for i in checked_avoids if checked_avoids[i] is True]
 
-    ### Set up base df and keep only checked categories
-    results_df = setup_base_results_df(names_list, checked_avoid_categories)
-    filtered_avoids_df = avoids_df[avoids_df[c.CATEGORY_FIELD].isin(checked_avoid_categories)]
+    ### Keep only avoids in checked categories and not in any ignore string
+    allowed = avoid_index.allowed_mask(checked_avoid_categories, ignore_list)
+    results = ResultsBuilder(avoid_index, checked_avoid_categories)
+
+    ### Run check for each name, results come back in names_list order
+    cache_key = hits_cache_key(avoid_index, checked_avoid_categories, ignore_list)
+    for name, hits in screen_names(names_list, avoid_index, allowed, workers, cache, cache_key):
+        results.add(name, hits)
+
+    return results.to_df()
 
-    ### Run check for each name
-    for name in names_list:
-        results_df = check_name_against_avoids(name, filtered_avoids_df, ignore_list, results_df)
 
-    ### Get list of all category columns in the resutls dataframe, removeing 'Name'
-    cat_cols = list(results_df.columns)
-    cat_cols.remove(c.NAME_FIELD)
+def hits_cache_key(avoid_index, checked_avoid_categories, ignore_list):
+    """ Returns the part of a hits cache key shared by every name in a check,
+        hits only carry over between checks with the same avoids version, categories and ignore list.
+    """
+    return avoid_index.version, tuple(sorted(checked_avoid_categories)), tuple(ignore_list)
 
-    ### Replace empty strings with NaN and drop columns where all values are null
-    # Then replace nulls back with empty string
-    results_df = results_df.replace('', np.NaN).dropna(subset=cat_cols, how='all')
-    results_df = results_df.dropna(axis=1, how='all')
-    results_df = results_df.replace(np.NaN, '')
 
-    return results_df
+def screen_names(names_list, avoid_index, allowed, workers=None, cache=None, cache_key=(), pool=None):
+    """ Yield (name, hits) for every name, in names_list order.
+        Large batches run on pool (a ScreenPool) if given, see _screen_names, workers is then ignored.
+        With a cache (LRUCache, HistoryStore or a TieredCache of both) names are looked up by (name, *cache_key)
+        first, see hits_cache_key, and only the names not found are screened.
+        Names are looked up as entered, as infix hits depend on case.
+    """
 
+    if cache is None:
+        yield from _screen_names(names_list, avoid_index, allowed, workers, pool)
+        return
 
-def check_prefix(name, avoid):
-    """ True if name starts with avoid. """
-    return name.lower().startswith(avoid.lower())
+    cached = {}
+    for name in names_list:
+        hits = cache.get((name,) + cache_key)
+        if hits is not None:
+            cached[name] = hits
+
+    METRICS.inc('cache_hits_total', len(cached))
+    METRICS.inc('cache_misses_total', len(names_list) - len(cached))
+
+    screened = _screen_names([name for name in names_list if name not in cached], avoid_index, allowed, workers, pool)
+    try:
+        for name in names_list:
+            if name in cached:
+                yield name, cached[name]
+            else:
+                name, hits = next(screened)
 
+                ### Only the hits are cached, labels are rebuilt from them when needed
+                cache.put((name,) + cache_key, list(hits) if isinstance(hits, LabeledHits) else hits)
+                yield name, hits
+    finally:
+        screened.close()
+        cache.flush()
 
-def check_infix(name, avoid):
-    """ True if avoid exists within the name (excluding first/last letter) """
-    return avoid in name[1:-1]
 
+class ScreenPool:
+    """ Process pool sharding screens across workers, kept across screens so the workers start, and receive the AvoidIndex,
+        once per avoids change rather than once per screen. The workers are restarted when a screen uses another index.
+        Use as a context manager, or call shutdown when done.
+    """
 
-def check_suffix(name, avoid):
-    """ True if name ends with avoid. """
-    return name.lower().endswith(avoid.lower())
+    def __init__(self, workers=None):
+        workers = c.SCREEN_WORKERS if workers is None else workers
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._avoid_index = None
 
+    def __enter__(self):
+        return self
 
-def check_anywhere(name, avoid):
-    """ True if the avoid is anywhere in the name. """
-    return avoid.lower() in name.lower()
+    def __exit__(self, *exc):
+        self.shutdown()
 
+    def executor(self, avoid_index):
+        """ Returns the ProcessPoolExecutor whose workers hold avoid_index, starting it if needed. """
 
-def check_string_compare(name, avoid):
-    """ True if the name matches or is contained within the avoid. """
-    return name.lower() in avoid.lower()
+        if self._executor is None or self._avoid_index is not avoid_index:
+            self.shutdown()
 
+            ### The index is handed over once per worker: inherited on fork, pickled once per process on spawn
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_screen_worker, initargs=(avoid_index,))
+            self._avoid_index = avoid_index
 
-def check_string_compare_combo(name, avoid):
-    """ True if the first letter and last 3 letters matches the avoid. """
-    return (name.lower()[0] == avoid.lower()[0]) and (name.lower()[-3:] == avoid.lower()[-3:])
+        return self._executor
 
+    def shutdown(self):
+        """ Stop the workers, dropping any chunks not yet started. """
 
-def check_string_compare_n_letters(name, avoid, n):
-    """ Returns First n-letter substring shared between the name and avoid. """
-    for i in range(len(name)-(n-1)):
-        if name.lower()[i:i+n] in avoid.lower():
-            return name.lower()[i:i+n]
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            self._avoid_index = None
+
+
+def _screen_names(names_list, avoid_index, allowed, workers=None, pool=None):
+    """ Yield (name, hits) for every name, in names_list order.
+        Batches of at least PARALLEL_MIN_NAMES are sharded across a process pool when more than one worker is set,
+        the ScreenPool given or one started for this screen only.
+        Matching stage times and per-name latency are recorded in METRICS once the generator finishes or is closed,
+        see _record_screen.
+    """
+
+    if pool is None:
+        workers = c.SCREEN_WORKERS if workers is None else workers
+        workers = workers or os.cpu_count() or 1
     else:
-        return None
-
-### Functions mapped to a type
-TYPE_CHECK_FUNCS = {
-    c.PREFIX:               check_prefix,
-    c.INFIX:                check_infix,
-    c.SUFFIX:               check_suffix,
-    c.ANYWHERE:             check_anywhere,
-    c.NAME_MATCH:           check_string_compare,
-}
-
-def check_name_against_avoids(name, avoids_df, ignore_list, results_df):
-    """ Check a single name against a full avoids dataframe. Append the results to results_df """
-
-    ### Filter out all avoids contained within any ignore string
-    ignore_mask = [not any(a in i for i in ignore_list) for a in avoids_df[c.VALUE_FIELD]]
-    avoids_df = avoids_df[ignore_mask].drop_duplicates()
-
-    ### Split dataframe on string_compare and non-string_compare avoid types
-    sc_avoids_df = avoids_df[avoids_df[c.TYPE_FIELD] == c.STRING_COMPARE]
-    avoids_df = avoids_df[avoids_df[c.TYPE_FIELD] != c.STRING_COMPARE]
-
-    ### Filter non-string_compare df on where there are hits
-    avoids_df['hit'] = [TYPE_CHECK_FUNCS[t](name, v) for v, t in zip(avoids_df[c.VALUE_FIELD], avoids_df[c.TYPE_FIELD])]
-    res_df = avoids_df[avoids_df['hit'] == True]
-    res_df[c.NAME_FIELD] = name
-
-    ### Pivot hits table, starting building final result in new dictionary
-    piv = pd.pivot_table(res_df, values=[c.VALUE_FIELD, c.TYPE_FIELD], columns=c.CATEGORY_FIELD, aggfunc=lambda x: ','.join(x))
-
-    df_dict = {
-        c.NAME_FIELD: [name]
-    }
-
-    for cat in list(piv.columns):
-        typs = piv[cat].values[0].split(',')
-        vals = piv[cat].values[1].split(',')
-        z = list(zip(vals, [f'({t})' for t in typs]))
-        df_dict[cat] = ['\n'.join([' '.join(i) for i in z])]
-
-    ### Check for string_compare hits
-    if not sc_avoids_df.empty:
-        for ind, row in sc_avoids_df[[c.VALUE_FIELD, c.CATEGORY_FIELD]].iterrows():
-            val = row[c.VALUE_FIELD]
-            cat = row[c.CATEGORY_FIELD]
-            val_str = None
-
-            ### For simple compare, does the name match or is it contained in the avoid
-            if check_string_compare(name, val):
-                val_str = f'{val} (string match)'
-            ### Do the name and avoid share the same 1st and final 3 letters
-            elif check_string_compare_combo(name, val):
-                val_str = f'{val} ({name[0]}--{name[-3:]})'
-            else:
-                ### Do the name and avoid share any substring of n letters
-                # n decreases from len(name) to STRING_COMPARE_MINIMUM defined in config
-                for l in range(len(name), c.STRING_COMPARE_MINIMUM-1, -1):
-                    ret = check_string_compare_n_letters(name, val, l)
-                    if ret is not None:
-                        val_str = f'{val} (*{ret}*)'
-                        break
-
-            ### format the val_str if exists
-            if val_str is not None:
-                try:
-                    new_val = f'{df_dict[cat]}\n{val_str}'
-                    df_dict[cat] = new_val
-                except KeyError:
-                    df_dict[cat] = val_str
-
-    ### Create the result from df_dict and return concatted results
-    df = pd.DataFrame.from_dict(df_dict)
-    return pd.concat([results_df, df])
+        workers = pool.workers
+
+    timings = {}
+    latency = Histogram()
+
+    if workers <= 1 or len(names_list) < c.PARALLEL_MIN_NAMES:
+        try:
+            for i, name in enumerate(names_list):
+                start = perf_counter()
+                hits = avoid_index.find_hits(name, allowed, timings if i % c.METRICS_SAMPLE_EVERY == 0 else None)
+                latency.observe(perf_counter() - start)
+                yield name, hits
+        finally:
+            _record_screen(timings, latency)
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ScreenPool(workers)
+
+    chunks = [names_list[i:i+c.PARALLEL_CHUNK_SIZE] for i in range(0, len(names_list), c.PARALLEL_CHUNK_SIZE)]
+    executor = pool.executor(avoid_index)
+    futures = [executor.submit(_screen_chunk, chunk, bytes(allowed)) for chunk in chunks]
+    try:
+        for chunk, future in zip(chunks, futures):
+            packed, labels, chunk_timings, chunk_latency = future.result()
+            for stage, seconds in chunk_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+            latency.merge(chunk_latency)
+            yield from zip(chunk, _unpack_hits(avoid_index, packed, labels))
+    finally:
+        ### Closing the generator early (e.g. a cancelled check) drops any chunks not yet started
+        for future in futures:
+            future.cancel()
+        if own_pool:
+            pool.shutdown()
+        _record_screen(timings, latency)
+
+
+def _record_screen(timings, latency):
+    """ Add a screen's matching stage times and per-name latencies to METRICS.
+        Stage times only cover the sampled names (see METRICS_SAMPLE_EVERY), so they are scaled up
+        to the time spent on every name, keeping the sampled share of each stage.
+    """
+
+    sampled = sum(timings.values())
+    if sampled > 0:
+        METRICS.add_stage_times({stage: seconds / sampled * latency.sum for stage, seconds in timings.items()})
+    METRICS.merge('name_seconds', latency)
+    METRICS.inc('names_screened_total', latency.count)
+
+
+### string_compare match kinds by code in packed hits, code 0 being the avoid's own type
+_MATCH_CODES = {match: code for code, match in enumerate(STRING_COMPARE_MATCHES, 1)}
+
+
+def _pack_hits(chunk_hits):
+    """ Returns a chunk's hits as (hits per name, int32 array of position, match code, offset, length per hit), -1 for None.
+        Pickles to a fraction of the size (and time) of the Hit tuples, which matters as names can have hundreds of hits.
+    """
+
+    counts = [len(hits) for hits in chunk_hits]
+    flat = [hit for hits in chunk_hits for hit in hits]
+    if not flat:
+        return counts, np.empty((0, 4), dtype=np.int32)
+
+    ### Columns are converted in bulk, None offsets/lengths becoming NaN on the way to -1
+    positions, matches, offsets, lengths = (list(map(itemgetter(i), flat)) for i in range(4))
+    codes = list(map(_MATCH_CODES.get, matches, repeat(0)))
+    rows = np.column_stack([positions, codes, np.array(offsets, dtype=float), np.array(lengths, dtype=float)])
+    return counts, np.nan_to_num(rows, nan=-1).astype(np.int32)
+
+
+def _unpack_hits(avoid_index, packed, labels):
+    """ Yield LabeledHits per name of hits packed by _pack_hits, with the name's labels.
+        Columns are converted with numpy and Hits built by tuple.__new__, keeping the per-hit work of the parent process,
+        which doesn't scale with workers, to a minimum.
+    """
+
+    counts, rows = packed
+    types = np.array(avoid_index.types + (None,), dtype=object)
+    kinds = np.array((None,) + STRING_COMPARE_MATCHES, dtype=object)
+
+    positions, codes, offsets, lengths = rows.T
+    columns = zip(
+        positions.tolist(),
+        np.where(codes == 0, types[positions], kinds[codes]).tolist(),
+        np.where(offsets < 0, None, offsets).tolist(),
+        np.where(lengths < 0, None, lengths).tolist(),
+        )
+
+    ### Hits are built a name at a time, as they are consumed
+    make_hit = partial(tuple.__new__, Hit)
+    for count, name_labels in zip(counts, labels):
+        name_hits = LabeledHits(map(make_hit, islice(columns, count)))
+        name_hits.labels = name_labels
+        yield name_hits
+
+
+### AvoidIndex of the current ScreenPool, set in each worker process
+_worker_state = {}
+
+
+def _init_screen_worker(avoid_index):
+    """ Process pool initializer, keeps the index for every chunk this worker screens. """
+    _worker_state['avoid_index'] = avoid_index
+
+
+def _screen_chunk(names, allowed):
+    """ Screen a chunk of names in a worker process, allowed being the allowed mask as bytes.
+        Returns the chunk's packed hits (see _pack_hits) and labels per name (see group_hit_labels),
+        with its stage timings and per-name latency Histogram for the parent's METRICS.
+        Labels are formatted here as, with hundreds of hits a name, they would otherwise be most of the parent's work.
+    """
+
+    avoid_index = _worker_state['avoid_index']
+
+    timings = {}
+    latency = Histogram()
+    chunk_hits = []
+    for i, name in enumerate(names):
+        start = perf_counter()
+        chunk_hits.append(avoid_index.find_hits(name, allowed, timings if i % c.METRICS_SAMPLE_EVERY == 0 else None))
+        latency.observe(perf_counter() - start)
+
+    labels = [group_hit_labels(avoid_index, name, hits) for name, hits in zip(names, chunk_hits)]
+    return _pack_hits(chunk_hits), labels, timings, latency
 
 
 """
@@ -1,86 +1,334 @@
+import atexit
+import itertools
 import logging
+import queue
+import statistics
+import sys
+import time
+from collections import OrderedDict, deque
 from functools import wraps
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-from src.utils.data_models import UserError
+import src.utils.constants as c
+
+
+
+class UserError(Exception):
+    """ Error to raise when a user triggers an event without certain other requirements satisfied. """
+
+
+class CallStats:
+    """ Call count of a traced function, with a ring buffer of (seconds, failed) for its most recent sampled calls. """
+
+    def __init__(self, buffer_size):
+        ### itertools.count, as next() on it is atomic across threads
+        self.calls = itertools.count(1)
+        self.recent = deque(maxlen=buffer_size)
+        self.count = 0
+
+    def summary(self):
+        """ Returns call count and timings of the calls in the ring buffer. """
+
+        recent = list(self.recent)
+        seconds = sorted(s for s, _ in recent)
+        return {
+            'calls':        self.count,
+            'sampled':      len(recent),
+            'failed':       sum(failed for _, failed in recent),
+            'mean':         statistics.fmean(seconds) if seconds else None,
+            'p50':          seconds[len(seconds) // 2] if seconds else None,
+            'p95':          seconds[int(len(seconds) * 0.95)] if seconds else None,
+            'max':          seconds[-1] if seconds else None,
+            }
+
+
+class CallTracer:
+    """ In-memory call counts and wall times of error_handler decorated functions, see TRACE_CALLS in constants.
+        Whether a function is traced is fixed when it is decorated, so with tracing off the wrapper has no tracing code at all.
+    """
+
+    def __init__(self, enabled=False, sample_every=1, buffer_size=256):
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.buffer_size = buffer_size
+        self.stats = {}
+
+    def register(self, func):
+        """ Returns the CallStats for a function, by qualified name. """
+
+        name = f'{func.__module__}.{func.__qualname__}'
+        return self.stats.setdefault(name, CallStats(self.buffer_size))
+
+    def summary(self):
+        """ Returns dict of function name: call summary, for every function called at least once. """
+        return {name: stats.summary() for name, stats in sorted(self.stats.items()) if stats.count}
+
+    def log_summary(self, logger):
+        """ Log a line per called function, busiest first. """
+
+        summary = sorted(self.summary().items(), key=lambda i: (i[1]['mean'] or 0) * i[1]['calls'], reverse=True)
+        for name, s in summary:
+            timing = f"mean {s['mean']:.6f}s p95 {s['p95']:.6f}s max {s['max']:.6f}s" if s['sampled'] else 'not sampled'
+            logger.info(f"Trace | {name} | {s['calls']} calls | {timing} | {s['failed']} failed of {s['sampled']} sampled")
+
+
+### Tracer of the running app, configured once from the config when this module is imported
+TRACER = CallTracer(c.TRACE_CALLS, c.TRACE_SAMPLE_EVERY, c.TRACE_BUFFER_SIZE)
 
 
 def error_handler(func):
-    """ Wrapper for handling potential errors. """
+    """ Wrapper for handling potential errors.
+        With call tracing enabled each call is counted, and sampled calls are timed into TRACER.
+    """
 
     @wraps(func)
     def wrapper(*args, **kwargs):
         """ """
-        ret = None
-        obj = args[0] if args else None
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return route_error(args, e)
+
+    if not TRACER.enabled:
+        return wrapper
 
+    stats = TRACER.register(func)
+    sample_every = TRACER.sample_every
+
+    @wraps(func)
+    def traced(*args, **kwargs):
+        """ """
+        stats.count = n = next(stats.calls)
+        if (n - 1) % sample_every:
+            return wrapper(*args, **kwargs)
+
+        start = time.perf_counter()
         try:
-            print(f'Calling {func.__name__}')
             ret = func(*args, **kwargs)
-        except UserError as e:
-            if obj is not None:
-                obj.raise_error(e)
-            else:
-                raise e
         except Exception as e:
-            print(e)
-            if obj is not None:
-                obj.raise_critical_error(e)
-            else:
-                raise e
+            stats.recent.append((time.perf_counter() - start, True))
+            return route_error(args, e)
+
+        stats.recent.append((time.perf_counter() - start, False))
         return ret
 
-    return wrapper
+    return traced
+
+
+def route_error(args, e):
+    """ Errors are routed to the UI object when called as one of its methods (args[0]), raised otherwise. """
+
+    obj = args[0] if args and hasattr(args[0], 'raise_error') else None
+
+    if isinstance(e, UserError):
+        if obj is None:
+            raise e
+        obj.raise_error(e)
+        return None
+
+    print(e, file=sys.stderr)
+    if obj is None:
+        raise e
+    obj.raise_critical_error(e)
+    return None
+
+
+class FieldsFormatter(logging.Formatter):
+    """ Formatter appending structured fields passed as extra={'fields': {...}}, e.g. '... | names=120 avoids=1161'. """
+
+    def format(self, record):
+        text = super(FieldsFormatter, self).format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' | ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return text
 
 
 class Logger(logging.Logger):
-    """ """
+    """ App logger, records are put on a queue and written to the console and a rotating log file by a background listener,
+        so logging from the GUI or worker threads never waits on file or console IO.
+    """
 
-    custom_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    custom_formatter = FieldsFormatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
     log_file_path = 'output.log'
+    listener = None
+    exit_registered = False
 
     def setup(self, config, log_level=logging.INFO):
-        """ Setup the logger. """
+        """ Setup the logger.
+            LOG_FILE_PATH in the config sets the log file (empty for console only), rotated at LOG_MAX_BYTES keeping LOG_BACKUP_COUNT files.
+        """
 
         self.config = config
         self.log_level = log_level if log_level is not None else logging.INFO
         self.log_file_path = config.get('LOG_FILE_PATH', self.log_file_path)
-        self._set_console_handler()
         self.setLevel(self.log_level)
 
-    def _set_console_handler(self):
-        """ Set a basic console handler. """
+        ### Set up again (e.g. a second setup call), stop the previous listener first
+        self.shutdown()
+
+        handlers = [h for h in (self._get_console_handler(), self._get_file_handler()) if h is not None]
+
+        log_queue = queue.SimpleQueue()
+        self.addHandler(QueueHandler(log_queue))
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+        ### Write out anything still queued when the app exits, registered once however many times setup is called
+        if not self.exit_registered:
+            atexit.register(self.shutdown)
+            self.exit_registered = True
+
+    def shutdown(self):
+        """ Stop the listener once it has written every queued record, and detach the queue handler. """
+
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+        for handler in [h for h in self.handlers if isinstance(h, QueueHandler)]:
+            self.removeHandler(handler)
+
+    def _get_console_handler(self):
+        """ Returns a basic console handler, None if there is no console (e.g. the --noconsole exe). """
+
+        if sys.stderr is None:
+            return None
 
         ch = logging.StreamHandler()
         ch.setLevel(self.log_level)
         ch.setFormatter(self.custom_formatter)
-        return True
+        return ch
+
+    def _get_file_handler(self):
+        """ Returns a rotating file handler for log_file_path, None if disabled or the file can't be opened. """
+
+        if not self.log_file_path:
+            return None
+
+        try:
+            fh = RotatingFileHandler(
+                self.log_file_path,
+                maxBytes=int(self.config.get('LOG_MAX_BYTES', 5 * 1024 * 1024)),
+                backupCount=int(self.config.get('LOG_BACKUP_COUNT', 3)),
+                encoding='utf-8',
+                )
+        except OSError as e:
+            print(f'Could not open log file {self.log_file_path}: {e}', file=sys.stderr)
+            return None
+
+        fh.setLevel(self.log_level)
+        fh.setFormatter(self.custom_formatter)
+        return fh
+
+
+
+class LRUCache:
+    """ Mapping bounded to maxsize entries, the least recently used entry is dropped first. A maxsize of 0 stores nothing. """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        """ Returns number of entries held. """
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """ Returns value for key, marking it most recently used, or default if not held. """
+
+        try:
+            value = self._data[key]
+        except KeyError:
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """ Store value for key, dropping the least recently used entry if over maxsize. """
+
+        if self.maxsize <= 0:
+            return
+
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def flush(self):
+        """ Nothing to write, kept in memory only. """
+
+    def clear(self):
+        """ Drop every entry. """
+        self._data.clear()
+
+
+class TieredCache:
+    """ Caches looked up in order, e.g. an in-memory LRUCache in front of an on-disk store.
+        Values found in a slower tier are copied into the faster ones, puts go to every tier.
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+
+    def get(self, key, default=None):
+        """ Returns value for key from the first tier holding it, or default. """
+
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.put(key, value)
+                return value
+
+        return default
+
+    def put(self, key, value):
+        """ Store value for key in every tier. """
+        for tier in self.tiers:
+            tier.put(key, value)
+
+    def flush(self):
+        """ Write out any tier buffering its puts. """
+        for tier in self.tiers:
+            tier.flush()
 
 
 
 class Timer:
-    """ Tiemr contextmanager for timing the start/end/interval for a given block of code."""
+    """ Timer contextmanager for timing the start/end/interval for a given block of code.
+        With metrics (a MetricsRegistry) the interval is added to the stage named message,
+        and is only logged if a logger is given rather than printed.
+    """
 
     start = None
     end = None
     interval = None
 
-    def __init__(self, logger, message):
+    def __init__(self, logger, message, metrics=None):
         self.logger = logger
         self.message = message
+        self.metrics = metrics
 
     def __enter__(self):
         self.start = datetime.now()
+        self._perf_start = time.perf_counter()
         if self.logger is not None:
             self.logger.info(f"Started | {self.message} | at {self.start}")
-        else:
+        elif self.metrics is None:
             print(f"Started | {self.message} | at {self.start}")
+        return self
 
     def __exit__(self, err_class, err_obj, traceback):
         self.end = datetime.now()
-        self.interval = (self.end - self.start).total_seconds()
+        self.interval = time.perf_counter() - self._perf_start
+
+        if self.metrics is not None:
+            self.metrics.add_stage_time(self.message, self.interval)
 
         if self.logger is not None:
             self.logger.info(f"Finished | {self.message} | after {self.interval} at {self.end}")
-        else:
+        elif self.metrics is None:
             print(f"Finished | {self.message} | after {self.interval} at {self.end}")
\ No newline at end of file
@@ -41,12 +41,38 @@ ANYWHERE = 'anywhere'
 STRING_COMPARE = 'string_compare'
 STRING_COMPARE_COMBO = 'combo'
 STRING_MATCH = 'string_match'
+N_LETTERS = 'n_letters'
 NAME_MATCH = 'name_match'
 
 STRING_COMPARE_MINIMUM = int(CONFIG.get("STRING_COMPARE_MINIMUM", 3))
 FIX_SIGNIFIERS = CONFIG.get('FIX_SIGNIFIERS', '-,~').split(',')
 ANYWHERE_SIGNIFIERS = CONFIG.get('ANYWHERE_SIGNIFIERS', '",*').split(',')
 
+### Parallel screening, SCREEN_WORKERS of 1 runs in-process, 0 uses every CPU
+SCREEN_WORKERS = int(CONFIG.get('SCREEN_WORKERS', 1))
+PARALLEL_MIN_NAMES = int(CONFIG.get('PARALLEL_MIN_NAMES', 2000))
+PARALLEL_CHUNK_SIZE = int(CONFIG.get('PARALLEL_CHUNK_SIZE', 250))
+
+### Hits remembered per name across checks, 0 disables the cache
+SCREEN_CACHE_SIZE = int(CONFIG.get('SCREEN_CACHE_SIZE', 50000))
+
+### Rows handed to the results table per fetch as it scrolls
+RESULTS_FETCH_SIZE = int(CONFIG.get('RESULTS_FETCH_SIZE', 500))
+
+### Names screened per chunk when streaming a names file, and conflicts of a streamed screen shown in the results table
+# every conflict is written to the results file, the table only previews the first ones
+STREAM_CHUNK_SIZE = int(CONFIG.get('STREAM_CHUNK_SIZE', 10000))
+STREAM_PREVIEW_ROWS = int(CONFIG.get('STREAM_PREVIEW_ROWS', 1000))
+
+### Matching is broken down by avoid type on one in every METRICS_SAMPLE_EVERY names, 1 times every name
+METRICS_SAMPLE_EVERY = max(int(CONFIG.get('METRICS_SAMPLE_EVERY', 10)), 1)
+
+### Call tracing of error_handler decorated functions, off unless TRACE_CALLS is 1
+# one in every TRACE_SAMPLE_EVERY calls is timed, the last TRACE_BUFFER_SIZE timings are kept per function
+TRACE_CALLS = CONFIG.get('TRACE_CALLS', '0') == '1'
+TRACE_SAMPLE_EVERY = max(int(CONFIG.get('TRACE_SAMPLE_EVERY', 1)), 1)
+TRACE_BUFFER_SIZE = int(CONFIG.get('TRACE_BUFFER_SIZE', 256))
+
 CONFIG_AVOIDS_HEADER = 'PROJ_COMP_AVOIDS'
 
 PROJECT_AVOID_PLACEHOLDER_TEXT = """Enter project-specific avoids, such as prefix, infix or suffix letter strings. One avoid per line.
@@ -64,4 +90,14 @@ Will be screened for identical matches.
 COMPETITORS_PLACEHOLDER_TEXT = """Enter competitor names here. One name per line.
 
 Will be screened for similar letter strings.
-"""
\ No newline at end of file
+"""
+
+### Save dialog filters of results files, each with its format and whether it writes a row per conflict
+RESULTS_FILE_FILTERS = {
+    'Excel (*.xlsx)':                               ('xlsx', False),
+    'CSV (*.csv)':                                  ('csv', False),
+    'JSON lines (*.jsonl)':                         ('jsonl', False),
+    'Excel, a row per conflict (*.xlsx)':           ('xlsx', True),
+    'CSV, a row per conflict (*.csv)':              ('csv', True),
+    'JSON lines, a row per conflict (*.jsonl)':     ('jsonl', True),
+}
\ No newline at end of file
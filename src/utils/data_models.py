@@ -1,36 +1,59 @@
 
-from PyQt5.QtCore import Qt, QAbstractTableModel
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+### UserError lives in common_utils so non-Qt code can raise it, kept importable from here
+from src.utils.common_utils import UserError
 
 
 
 class QTPandasModel(QAbstractTableModel):
-    """ Set up a pandas data model for diplaying/interacting with a pandas dataframe in qtableview. """
+    """ Set up a pandas data model for diplaying/interacting with a pandas dataframe in qtableview.
+        The dataframe itself is never reordered, view rows map onto its row positions through the sort order
+        and an optional row filter. Display strings are snapshotted per column when data is set,
+        so Qt's data/headerData calls are list lookups rather than dataframe access.
+    """
 
     def __init__(self, data, parent=None):
         QAbstractTableModel.__init__(self, parent)
         self._data = data
         self._columns = data.columns
+        self._headers = list(data.columns)
+        self._display = [self.column_strings(data, col) for col in range(data.shape[1])]
+
+        ### Array of data row positions in sort order (None until sorted), boolean array of rows passing the filter
+        # (None if not filtered) and the resulting list of data row positions shown
+        self._order = None
+        self._row_filter = None
+        self._rows = list(range(data.shape[0]))
+
+        ### Sort keys per column and sort orders per (column, ascending), dropped when the data changes
+        self._sort_keys = {}
+        self._sort_orders = {}
+
+    @staticmethod
+    def column_strings(df, col):
+        """ Returns list of display strings for a column of df by position. """
+        return df.iloc[:, col].astype(str).tolist()
 
     def rowCount(self, parent=None):
         """ Returns row count of data. """
-        return self._data.shape[0]
+        return len(self._rows)
 
     def columnCount(self, parent=None):
         """ Returns column count of data. """
-        return self._data.shape[1]
+        return len(self._display)
 
     def data(self, index, role=Qt.DisplayRole):
         """ """
         if index.isValid():
             if role == Qt.DisplayRole or role == Qt.EditRole:
-                value = self._data.iloc[index.row(), index.column()]
-                return str(value)
+                return self._display[index.column()][self._rows[index.row()]]
         return None
 
     def headerData(self, col, orientation, role):
         """ """
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return self._data.columns[col]
+            return self._headers[col]
         return None
 
     def flags(self, index):
@@ -39,21 +62,160 @@ class QTPandasModel(QAbstractTableModel):
     def setData(self, index, value, role):
         """ Get/Set edited cell data. """
         if role == Qt.EditRole:
-            cur_val = self._data.iloc[index.row(),index.column()]
-            print(f'Changing {cur_val} to {value} at row: {index.row()}, column: {index.column()}')
-            self._data.iloc[index.row(),index.column()] = value
+            row = self._rows[index.row()]
+            cur_val = self._data.iloc[row,index.column()]
+            print(f'Changing {cur_val} to {value} at row: {row}, column: {index.column()}')
+            self._data.iloc[row,index.column()] = value
+            self._display[index.column()][row] = str(value)
+            self.clear_sort_cache(index.column())
             return True
 
+    def set_row_filter(self, mask):
+        """ Show only data rows where the boolean array mask is True, or every row if None. The sort order is kept. """
+
+        self.beginResetModel()
+        self._row_filter = mask
+        self._apply_row_filter()
+        self.endResetModel()
+
+    def _apply_row_filter(self):
+        """ Set the shown rows from the sort order and row filter. """
+
+        if self._order is None:
+            self._rows = list(range(self._data.shape[0])) if self._row_filter is None else self._row_filter.nonzero()[0].tolist()
+        elif self._row_filter is None:
+            self._rows = self._order.tolist()
+        else:
+            self._rows = self._order[self._row_filter[self._order]].tolist()
+
+    def append_rows(self, df):
+        """ Append rows of a dataframe with the same columns to the end of the model. """
+
+        if df.empty:
+            return
+
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + df.shape[0] - 1)
+        self._append_data(df)
+        self.endInsertRows()
+
+    def _append_data(self, df):
+        """ Add rows to the data and display strings, without notifying views. """
+
+        ### pandas is already loaded by the time rows arrive, kept off this module's import for startup
+        import numpy as np
+        import pandas as pd
+
+        ### New rows go at the end of the view, shown even if a row filter is set
+        new_rows = range(self._data.shape[0], self._data.shape[0] + df.shape[0])
+        self._data = pd.concat([self._data, df], ignore_index=True)
+        for col, strings in enumerate(self._display):
+            strings.extend(self.column_strings(df, col))
+        if self._order is not None:
+            self._order = np.concatenate([self._order, new_rows])
+        if self._row_filter is not None:
+            self._row_filter = np.concatenate([self._row_filter, np.ones(len(new_rows), dtype=bool)])
+        self._rows.extend(new_rows)
+        self.clear_sort_cache()
+
     def sort(self, Ncol, order):
-        """ """
+        """ Sort the view on a column through a cached permutation, the underlying dataframe keeps its order. """
         self.layoutAboutToBeChanged.emit()
-        self._data = self._data.sort_values(
-            self._columns[Ncol],
-            ascending=order==Qt.AscendingOrder
-            )
+        self._order = self.sort_order(Ncol, order == Qt.AscendingOrder)
+        self._apply_row_filter()
         self.layoutChanged.emit()
 
+    def sort_order(self, col, ascending):
+        """ Returns array of data row positions sorted on a column, stable and cached per column and direction. """
+
+        key = (col, ascending)
+        if key not in self._sort_orders:
+            keys = self.sort_keys(col)
+            self._sort_orders[key] = (keys if ascending else -keys).argsort(kind='stable')
+        return self._sort_orders[key]
+
+    def sort_keys(self, col):
+        """ Returns integer array ranking each data row on the column's display string, equal strings share a rank.
+            Strings are compared once per column, every sort after that is an integer argsort.
+        """
+
+        if col not in self._sort_keys:
+            import numpy as np
+
+            strings = self._display[col]
+            order = sorted(range(len(strings)), key=strings.__getitem__)
+
+            ### Rank goes up by one at every change of string along the sorted order
+            sorted_strings = [strings[pos] for pos in order]
+            ranks = np.empty(len(strings), dtype=np.intp)
+            ranks[order] = np.cumsum([False] + [a != b for a, b in zip(sorted_strings, sorted_strings[1:])])
+            self._sort_keys[col] = ranks
+
+        return self._sort_keys[col]
+
+    def clear_sort_cache(self, col=None):
+        """ Drop cached sort keys/orders for a column, or for every column if None. """
+
+        if col is None:
+            self._sort_keys.clear()
+            self._sort_orders.clear()
+        else:
+            self._sort_keys.pop(col, None)
+            self._sort_orders.pop((col, True), None)
+            self._sort_orders.pop((col, False), None)
+
+
+class LazyPandasModel(QTPandasModel):
+    """ QTPandasModel handing rows to the view in batches of fetch_size as it scrolls (canFetchMore/fetchMore).
+        Views only lay out the rows fetched so far, so a very large table opens as fast as a small one.
+    """
+
+    def __init__(self, data, parent=None, fetch_size=500):
+        QTPandasModel.__init__(self, data, parent)
+        self.fetch_size = fetch_size
+        self._fetched = fetch_size
+
+    def rowCount(self, parent=None):
+        """ Returns number of rows fetched by the view so far. """
+        return min(self._fetched, len(self._rows))
+
+    def canFetchMore(self, parent):
+        """ True while there are rows the view hasn't fetched. """
+        return not parent.isValid() and self._fetched < len(self._rows)
+
+    def fetchMore(self, parent):
+        """ Hand the next batch of rows to the view. """
+
+        first = self.rowCount()
+        count = min(self.fetch_size, len(self._rows) - first)
+        if parent.isValid() or count <= 0:
+            return
+
+        self.beginInsertRows(QModelIndex(), first, first + count - 1)
+        self._fetched = first + count
+        self.endInsertRows()
+
+    def set_row_filter(self, mask):
+        """ Filter rows as QTPandasModel, the view then starts again from the first batch. """
+
+        self.beginResetModel()
+        self._fetched = self.fetch_size
+        self._row_filter = mask
+        self._apply_row_filter()
+        self.endResetModel()
+
+    def append_rows(self, df):
+        """ Append rows to the end of the model, only those within the rows fetched so far are shown straight away. """
+
+        if df.empty:
+            return
 
+        first = self.rowCount()
+        last = min(self._fetched, len(self._rows) + df.shape[0]) - 1
+        if last < first:
+            self._append_data(df)
+            return
 
-class UserError(Exception):
-    """ Error to raise when a user triggers an event without certain other requirements satisfied. """
\ No newline at end of file
+        self.beginInsertRows(QModelIndex(), first, last)
+        self._append_data(df)
+        self.endInsertRows()
@@ -1,54 +1,215 @@
 import configparser
+import hashlib
+import os
+import pickle
 from os import path
 
-import pandas as pd
 import numpy as np
+import openpyxl
+import pandas as pd
 
 import src.utils.constants as c
-from src.utils.common_utils import error_handler
-from src.utils.data_models import UserError
+from src.utils.common_utils import UserError, error_handler
+
+
+### Bump when the cached layout or the parsing in read_avoids_workbook changes, older caches are then rebuilt
+AVOIDS_CACHE_VERSION = 3
+AVOIDS_FIELDS = [c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD, c.CATEGORY_FIELD]
+
+### Cell texts pd.read_excel reads as missing by default, treated the same so types and descriptions parse as they did with pandas
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null',
+    ])
 
 
 @error_handler
 def get_avoids_from_file(logger, config):
-    """ Pulls data from master excel sheet (path defined in the config), formats the df and sends back to be displayed in qtable view"""
+    """ Pulls data from master excel sheet (path defined in the config), formats the df and sends back to be displayed in qtable view
+        The parsed avoids are cached (AVOIDS_CACHE_PATH in the config, empty to disable) and only re-read when the workbook changes.
+    """
 
     file_path = config.get('PATH_TO_AVOIDS_FILE', 'avoids_master.xlsx')
+    cache_path = config.get('AVOIDS_CACHE_PATH', 'avoids_master.cache')
+
+    if not path.exists(file_path):
+        return None
 
-    consol_df = None
-    ### For each sheet, get the sheet's data and concat to consolidated dataframe
-    for s_name in (c.INN, c.LINGUISTIC, c.MARKET_RESEARCH):
+    if cache_path:
+        consol_df = read_avoids_cache(cache_path, file_path)
+        if consol_df is not None:
+            return consol_df
+
+    consol_df = read_avoids_workbook(file_path)
+
+    if cache_path:
         try:
-            df = pd.read_excel(file_path, sheet_name=s_name, dtype=str)
-        except FileNotFoundError as e:
+            write_avoids_cache(cache_path, file_path, consol_df)
+        except OSError as e:
+            if logger is not None:
+                logger.warning(f'Could not write avoids cache {cache_path}: {e}')
+
+    return consol_df
+
+
+def get_all_avoids(logger, config, addtl_avoids_df=None):
+    """ Master avoids plus any parsed project/competitor/internal avoids, de-duplicated.
+        Raises UserError if the master file could not be found/read.
+    """
+
+    avoids_df = get_avoids_from_file(logger, config)
+    if avoids_df is None:
+        raise UserError("Master avoids file could not be found/read\nPlease check the path defined in NameEvaluator_conf.ini")
+
+    if addtl_avoids_df is not None:
+        avoids_df = pd.concat([avoids_df, addtl_avoids_df])
+
+    return avoids_df.drop_duplicates(subset=[c.VALUE_FIELD, c.TYPE_FIELD, c.CATEGORY_FIELD])
+
+
+def read_avoids_workbook(file_path):
+    """ Parse the master avoids workbook, one sheet per category.
+        The workbook is opened once in read-only (streaming) mode and rows of every sheet are cleaned
+        and appended to the columns in a single pass.
+    """
+
+    columns = {field: [] for field in AVOIDS_FIELDS}
+    values = columns[c.VALUE_FIELD]
+    types = columns[c.TYPE_FIELD]
+    descriptions = columns[c.DESCRIPTION_FIELD]
+    categories = columns[c.CATEGORY_FIELD]
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for s_name in (c.INN, c.LINGUISTIC, c.MARKET_RESEARCH):
+            if s_name not in workbook.sheetnames:
+                raise UserError(f"Master avoids file has no '{s_name}' sheet")
+
+            rows = workbook[s_name].iter_rows(values_only=True)
+            value_i, type_i, desc_i = get_header_positions(s_name, next(rows, ()))
+
+            for row in rows:
+                ### Filter out anything with no type
+                avoid_type = cell_text(row, type_i)
+                if avoid_type is None:
+                    continue
+
+                value = row[value_i] if value_i < len(row) else None
+                desc = cell_text(row, desc_i)
+
+                ### Clean/remove non-alpha characters, fill null descriptions with default string
+                values.append(clean_text('' if value is None else str(value)))
+                types.append(avoid_type)
+                descriptions.append('--' if desc is None else desc)
+                categories.append(s_name)
+    finally:
+        workbook.close()
+
+    return pd.DataFrame(columns, columns=AVOIDS_FIELDS)
+
+
+def cell_text(row, i):
+    """ Returns the text of cell i of a row, None if missing, empty or one of NA_STRINGS. """
+
+    cell = row[i] if i < len(row) else None
+    if cell is None or str(cell) in NA_STRINGS:
+        return None
+    return str(cell)
+
+
+def get_header_positions(sheet_name, header):
+    """ Returns column positions of the value, type and description fields in a sheet's header row.
+        Any other columns are ignored.
+    """
+
+    positions = {}
+    for i, field in enumerate(header):
+        if field is not None:
+            positions.setdefault(str(field), i)
+
+    try:
+        return tuple(positions[field] for field in (c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD))
+    except KeyError as e:
+        raise UserError(f"Sheet '{sheet_name}' in the master avoids file is missing the {e} column")
+
+
+def clean_text(val):
+    """ Keep only alphabetic characters. """
+    return ''.join([ch for ch in val if ch.isalpha()])
+
+
+def get_file_signature(file_path):
+    """ Returns (mtime_ns, size) of a file. """
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_file_hash(file_path):
+    """ Returns sha256 hex digest of a file's contents. """
+
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def read_avoids_cache(cache_path, file_path):
+    """ Returns the cached avoids df if the cache was built from the current workbook, else None.
+        Same mtime and size is trusted as is, a changed mtime with the same size falls back to the content hash.
+    """
+
+    try:
+        with open(cache_path, 'rb') as f:
+            cache = pickle.load(f)
+
+        source = cache['source']
+        if cache['version'] != AVOIDS_CACHE_VERSION or source['path'] != path.abspath(file_path):
             return None
 
-        df[c.CATEGORY_FIELD] = s_name
+        mtime_ns, size = get_file_signature(file_path)
+        if size != source['size']:
+            return None
 
-        if consol_df is None:
-            consol_df = df
-        else:
-            consol_df = pd.concat([consol_df, df])
+        if mtime_ns != source['mtime_ns']:
+            if get_file_hash(file_path) != source['sha256']:
+                return None
 
-    ### Filter out anything with no type
-    consol_df = consol_df[~consol_df[c.TYPE_FIELD].isnull()]
+            ### Workbook touched but unchanged, store the new mtime so the next read skips the hash
+            source['mtime_ns'] = mtime_ns
+            _write_cache_file(cache_path, cache)
 
-    ### Fill null descriptiosn with default string
-    consol_df[c.DESCRIPTION_FIELD] = consol_df[c.DESCRIPTION_FIELD].fillna('--')
+        return pd.DataFrame(cache['columns'], columns=AVOIDS_FIELDS)
 
-    ### Keep only exepected columns
-    consol_df = consol_df[[c.VALUE_FIELD, c.TYPE_FIELD, c.DESCRIPTION_FIELD, c.CATEGORY_FIELD]]
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        return None
 
-    def clean_text(val):
-        ret = ''.join([ch for ch in val if ch.isalpha()])
-        return ret
 
-    ### Clean/remove non-alpha characters
-    consol_df[c.VALUE_FIELD] = consol_df[c.VALUE_FIELD].apply(clean_text)
+def write_avoids_cache(cache_path, file_path, avoids_df):
+    """ Cache parsed avoids columns along with the workbook's mtime, size and content hash. """
 
-    return consol_df
+    mtime_ns, size = get_file_signature(file_path)
+    cache = {
+        'version': AVOIDS_CACHE_VERSION,
+        'source': {
+            'path': path.abspath(file_path),
+            'mtime_ns': mtime_ns,
+            'size': size,
+            'sha256': get_file_hash(file_path),
+        },
+        'columns': {field: avoids_df[field].tolist() for field in AVOIDS_FIELDS},
+    }
+    _write_cache_file(cache_path, cache)
 
 
+def _write_cache_file(cache_path, cache):
+    """ Write the cache to a temp file first, so a failed write never leaves a partial cache. """
+
+    tmp_path = f'{cache_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
 
 def parse_project_competitor_avoids(project_avoids_text, competitor_avoids_text, internal_names_text):
     """ Parse the text for both project and competitor avoids.
@@ -167,7 +328,7 @@ def read_project_competitor_from_file(config):
         comp_text = conf[c.CONFIG_AVOIDS_HEADER].get(c.COMPETITOR, '').replace(',', '\n')
         intr_text = conf[c.CONFIG_AVOIDS_HEADER].get(c.INTERNAL, '').replace(',', '\n')
     except KeyError:
-        return '', ''
+        return '', '', ''
 
     return proj_text, comp_text, intr_text
 
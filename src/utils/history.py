@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import string
+import threading
+import time
+from collections import namedtuple
+
+from src.utils.avoid_index import Hit, format_hit_label
+
+
+### Bump when the tables below change, older history files are then started afresh
+HISTORY_SCHEMA_VERSION = 2
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS avoid_sets (
+    version     TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    value       TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    PRIMARY KEY (version, position)
+);
+CREATE TABLE IF NOT EXISTS screens (
+    name        TEXT NOT NULL,
+    version     TEXT NOT NULL,
+    categories  TEXT NOT NULL,
+    ignore_list TEXT NOT NULL,
+    hits        TEXT NOT NULL,
+    screened_at REAL NOT NULL,
+    PRIMARY KEY (name, version, categories, ignore_list)
+);
+CREATE INDEX IF NOT EXISTS screens_lower_name ON screens (lower(name));
+CREATE INDEX IF NOT EXISTS screens_screened_at ON screens (screened_at);
+"""
+
+### SQLite's lower() only folds ASCII letters, names are looked up folded the same way
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+### Category of conflicts whose avoid isn't stored, listed rather than dropped so a screen with conflicts never reads as clean
+UNRESOLVED_CATEGORY = 'Unresolved'
+
+### A past screen of a name, conflicts being (category, label) pairs in hit order
+HistoryEntry = namedtuple('HistoryEntry', ['name', 'version', 'categories', 'ignore_list', 'screened_at', 'conflicts'])
+
+
+def open_history(logger, config):
+    """ Returns the HistoryStore at HISTORY_PATH in the config (empty to disable), None if disabled or it can't be opened.
+        Screens older than HISTORY_MAX_AGE_DAYS (0 to keep every screen) are deleted as it opens.
+    """
+
+    db_path = config.get('HISTORY_PATH', 'screen_history.db')
+    if not db_path:
+        return None
+
+    try:
+        history = HistoryStore(db_path)
+        max_age_days = float(config.get('HISTORY_MAX_AGE_DAYS', 180))
+        if max_age_days > 0:
+            history.prune(max_age_days)
+        return history
+    except sqlite3.Error as e:
+        if logger is not None:
+            logger.warning(f'Could not open screening history {db_path}: {e}')
+        return None
+
+
+class HistoryStore:
+    """ On-disk history of screened names, an sqlite database shared across sessions (and users, on a shared drive).
+        Screens are keyed by (name, avoids version, checked categories, ignore list), the same key as
+        the in-memory hits cache, so a HistoryStore can sit behind an LRUCache as a second tier (see TieredCache).
+        Names are stored as entered, find looks them up regardless of case through the index on lower(name).
+        Hits only hold avoid row positions, the avoids of each version are stored once in avoid_sets to resolve them.
+    """
+
+    def __init__(self, db_path, flush_size=1000):
+        self.db_path = db_path
+        self.flush_size = flush_size
+        self._pending = []
+
+        ### Avoid sets added by this store by version, written again on flush if pruned by another connection meanwhile
+        self._avoid_sets = {}
+
+        ### Checks and avoids loads run on worker threads, the connection is shared between them behind a lock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        if self._conn.execute('PRAGMA user_version').fetchone()[0] != HISTORY_SCHEMA_VERSION:
+            self._conn.executescript('DROP TABLE IF EXISTS avoid_sets; DROP TABLE IF EXISTS screens;')
+            self._conn.execute(f'PRAGMA user_version = {HISTORY_SCHEMA_VERSION}')
+        self._conn.executescript(HISTORY_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        """ Write any pending screens and close the database. """
+
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def add_avoid_set(self, avoid_index):
+        """ Store the avoids of an AvoidIndex version, if not stored already. """
+
+        with self._lock:
+            self._avoid_sets[avoid_index.version] = avoid_index.keys
+            with self._conn:
+                self._store_avoid_set(avoid_index.version, avoid_index.keys)
+
+    def _store_avoid_set(self, version, keys):
+        """ Insert the avoids of a version if not stored, within the caller's transaction. """
+
+        stored = self._conn.execute('SELECT 1 FROM avoid_sets WHERE version = ? LIMIT 1', (version,)).fetchone()
+        if not stored:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO avoid_sets VALUES (?, ?, ?, ?, ?)',
+                ((version, pos) + key for pos, key in enumerate(keys)),
+                )
+
+    def get(self, key, default=None):
+        """ Returns hits for a hits cache key (see hits_cache_key), or default if never screened. """
+
+        name, version, categories, ignore_list = key
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT hits FROM screens WHERE name = ? AND version = ? AND categories = ? AND ignore_list = ?',
+                (name, version, json.dumps(categories), json.dumps(ignore_list)),
+                ).fetchone()
+
+        if row is None:
+            return default
+        return [Hit(*hit) for hit in json.loads(row[0])]
+
+    def put(self, key, hits):
+        """ Record hits for a hits cache key, written in batches of flush_size. """
+
+        name, version, categories, ignore_list = key
+        with self._lock:
+            self._pending.append((name, version, json.dumps(categories), json.dumps(ignore_list), json.dumps(hits), time.time()))
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        """ Write pending screens in one transaction.
+            Their avoid sets are stored again first if a prune (e.g. from another session) deleted them while unused.
+        """
+
+        with self._lock:
+            if not self._pending:
+                return
+
+            with self._conn:
+                for version in {row[1] for row in self._pending}:
+                    if version in self._avoid_sets:
+                        self._store_avoid_set(version, self._avoid_sets[version])
+                self._conn.executemany('INSERT OR REPLACE INTO screens VALUES (?, ?, ?, ?, ?, ?)', self._pending)
+            self._pending = []
+
+    def prune(self, max_age_days):
+        """ Delete screens older than max_age_days, through the screened_at index, and any avoid sets left unused.
+            Returns the number of screens deleted.
+        """
+
+        with self._lock:
+            self.flush()
+            with self._conn:
+                deleted = self._conn.execute('DELETE FROM screens WHERE screened_at < ?', (time.time() - max_age_days * 86400,)).rowcount
+                if deleted:
+                    self._conn.execute('DELETE FROM avoid_sets WHERE version NOT IN (SELECT version FROM screens)')
+
+        return deleted
+
+    def find(self, name, prefix=False, limit=100):
+        """ Returns list of HistoryEntry for a name in any case, or every name starting with it if prefix, most recent first. """
+
+        name = name.translate(ASCII_LOWER)
+
+        if prefix:
+            ### Range over the lower(name) index, every string starting with name sorts between name and its successor
+            upper = name[:-1] + chr(ord(name[-1]) + 1) if name else '\U0010ffff'
+            where, args = 'lower(name) >= ? AND lower(name) < ?', (name, upper)
+        else:
+            where, args = 'lower(name) = ?', (name,)
+
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                f'SELECT name, version, categories, ignore_list, hits, screened_at FROM screens WHERE {where} '
+                'ORDER BY screened_at DESC LIMIT ?',
+                args + (limit,),
+                ).fetchall()
+
+            return [self._entry(*row) for row in rows]
+
+    def _entry(self, name, version, categories, ignore_list, hits, screened_at):
+        """ Build a HistoryEntry, resolving hit positions against the version's stored avoids.
+            Hits whose avoid isn't stored are listed under UNRESOLVED_CATEGORY.
+        """
+
+        conflicts = []
+        for hit in (Hit(*h) for h in json.loads(hits)):
+            avoid = self._conn.execute(
+                'SELECT value, category FROM avoid_sets WHERE version = ? AND position = ?', (version, hit.position)
+                ).fetchone()
+            if avoid is not None:
+                conflicts.append((avoid[1], format_hit_label(name, avoid[0], hit)))
+            else:
+                conflicts.append((UNRESOLVED_CATEGORY, format_hit_label(name, f'<avoid #{hit.position} not stored>', hit)))
+
+        return HistoryEntry(name, version, json.loads(categories), json.loads(ignore_list), screened_at, conflicts)
@@ -0,0 +1,270 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """ Multi-pattern string matcher.
+        Compiled once from (key, pattern) pairs, each text is then scanned in a single pass
+        and every pattern occurrence is reported as a (key, offset) pair.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._dict_link = [0]
+
+        for key, pattern in patterns:
+            self._add_pattern(key, pattern)
+
+        self._build_links()
+
+    def __len__(self):
+        """ Returns number of patterns compiled into the automaton. """
+        return sum(len(out) for out in self._out)
+
+    def _add_pattern(self, key, pattern):
+        """ Add a single pattern to the goto trie. """
+
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._dict_link.append(0)
+            node = nxt
+
+        self._out[node].append((key, len(pattern)))
+
+    def _build_links(self):
+        """ Breadth-first pass setting failure links and output (dictionary suffix) links. """
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+
+                ### Longest proper suffix of nxt which is also in the trie
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = fail
+
+                ### Nearest suffix node that ends a pattern, so a scan only visits real hits
+                self._dict_link[nxt] = fail if fail and self._out[fail] else self._dict_link[fail]
+
+    def search(self, text):
+        """ Yield (key, offset) for every occurrence of every pattern within text. """
+
+        ### Empty patterns are found in every text
+        for key, _ in self._out[0]:
+            yield key, 0
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        dict_link = self._dict_link
+
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            hit = node if out[node] else dict_link[node]
+            while hit:
+                for key, length in out[hit]:
+                    yield key, i - length + 1
+                hit = dict_link[hit]
+
+    def first_matches(self, text):
+        """ Returns dict of key: offset of the first occurrence for every pattern found in text. """
+
+        matches = {}
+        for key, offset in self.search(text):
+            if key not in matches:
+                matches[key] = offset
+        return matches
+
+
+class Trie:
+    """ Character trie over (key, pattern) pairs.
+        Walking a text reports every pattern the text starts with, visiting at most len(text) nodes.
+        With reverse=True patterns are stored reversed and the walk starts from the end of the text,
+        so the trie reports every pattern the text ends with instead.
+    """
+
+    _KEYS = None
+
+    def __init__(self, patterns, reverse=False):
+        self.reverse = reverse
+        self._root = {}
+        self._size = 0
+
+        for key, pattern in patterns:
+            node = self._root
+            for ch in (reversed(pattern) if reverse else pattern):
+                node = node.setdefault(ch, {})
+            node.setdefault(self._KEYS, []).append(key)
+            self._size += 1
+
+    def __len__(self):
+        """ Returns number of patterns stored in the trie. """
+        return self._size
+
+    def walk(self, text):
+        """ Yield (key, length) for every pattern found at the start (or end if reversed) of text. """
+
+        node = self._root
+        depth = 0
+        for ch in (reversed(text) if self.reverse else text):
+            for key in node.get(self._KEYS, ()):
+                yield key, depth
+
+            node = node.get(ch)
+            if node is None:
+                return
+            depth += 1
+
+        for key in node.get(self._KEYS, ()):
+            yield key, depth
+
+    def first_matches(self, text):
+        """ Returns dict of key: offset within text for every pattern found. """
+
+        if self.reverse:
+            return {key: len(text) - length for key, length in self.walk(text)}
+        return {key: 0 for key, _ in self.walk(text)}
+
+
+class SuffixAutomaton:
+    """ Generalized suffix automaton over (key, text) pairs.
+        In a single pass over a query it finds, for every stored text, the longest substring
+        the query shares with it, as long as that substring is at least min_length characters.
+    """
+
+    def __init__(self, texts, min_length=1):
+        self.min_length = max(min_length, 1)
+        self._next = [{}]
+        self._link = [-1]
+        self._len = [0]
+        self._keys = [None]
+        self._mark = [None]
+        self._size = 0
+
+        for key, text in texts:
+            last = 0
+            for ch in text:
+                last = self._extend(last, ch)
+                self._mark_state(last, key)
+            self._size += 1
+
+    def __len__(self):
+        """ Returns number of texts stored in the automaton. """
+        return self._size
+
+    def _new_state(self, length, nxt=None, link=-1, clone_of=None):
+        """ Append a state, clones take a copy of the original's transitions and keys. """
+
+        self._next.append({} if nxt is None else dict(nxt))
+        self._link.append(link)
+        self._len.append(length)
+
+        if clone_of is not None and self._keys[clone_of] is not None and length >= self.min_length:
+            self._keys.append(set(self._keys[clone_of]))
+            self._mark.append(self._mark[clone_of])
+        else:
+            self._keys.append(None)
+            self._mark.append(None)
+
+        return len(self._len) - 1
+
+    def _clone(self, p, q, ch):
+        """ Split state q so that the transition from p on ch leads to a state of length len(p) + 1. """
+
+        clone = self._new_state(self._len[p] + 1, self._next[q], self._link[q], clone_of=q)
+        while p != -1 and self._next[p].get(ch) == q:
+            self._next[p][ch] = clone
+            p = self._link[p]
+        self._link[q] = clone
+        return clone
+
+    def _extend(self, last, ch):
+        """ Extend the automaton from state last by character ch, returns the new last state. """
+
+        ### Transition already exists from a previous text
+        q = self._next[last].get(ch)
+        if q is not None:
+            if self._len[q] == self._len[last] + 1:
+                return q
+            return self._clone(last, q, ch)
+
+        cur = self._new_state(self._len[last] + 1)
+        p = last
+        while p != -1 and ch not in self._next[p]:
+            self._next[p][ch] = cur
+            p = self._link[p]
+
+        if p == -1:
+            self._link[cur] = 0
+        else:
+            q = self._next[p][ch]
+            if self._len[p] + 1 == self._len[q]:
+                self._link[cur] = q
+            else:
+                self._link[cur] = self._clone(p, q, ch)
+
+        return cur
+
+    def _mark_state(self, state, key):
+        """ Record key against state and its suffix-link ancestors which are long enough to report. """
+
+        while state > 0 and self._len[state] >= self.min_length and self._mark[state] != key:
+            if self._keys[state] is None:
+                self._keys[state] = set()
+            self._keys[state].add(key)
+            self._mark[state] = key
+            state = self._link[state]
+
+    def longest_matches(self, text):
+        """ Returns dict of key: (offset, length) of the longest substring of text found in each stored text.
+            Ties on length keep the left-most substring of text.
+        """
+
+        nxt = self._next
+        link = self._link
+        lens = self._len
+        keys = self._keys
+        min_length = self.min_length
+
+        best = {}
+        state = 0
+        length = 0
+        for i, ch in enumerate(text):
+            ### Follow suffix links until ch can extend the current match
+            while state and ch not in nxt[state]:
+                state = link[state]
+                length = lens[state]
+
+            if ch in nxt[state]:
+                state = nxt[state][ch]
+                length += 1
+            else:
+                length = 0
+
+            ### Every suffix of the current match long enough to report, longest first
+            s = state
+            l = length
+            while s > 0 and l >= min_length:
+                for key in keys[s] or ():
+                    if l > best.get(key, (0, 0))[1]:
+                        best[key] = (i - l + 1, l)
+                s = link[s]
+                l = lens[s]
+
+        return best
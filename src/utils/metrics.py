@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from src.utils.common_utils import TRACER
+
+
+### Stage names, per-type matching stages are named 'match_<avoid type>'
+STAGE_LOAD_AVOIDS = 'load_avoids'
+STAGE_BUILD_INDEX = 'build_index'
+STAGE_IGNORE_FILTER = 'ignore_filter'
+STAGE_STRING_COMPARE = 'string_compare'
+STAGE_RESULT_ASSEMBLY = 'result_assembly'
+STAGE_TABLE_RENDER = 'table_render'
+
+### Histogram bucket upper bounds in seconds, from a single name up to a production sized screen
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+def match_stage(avoid_type):
+    """ Returns the stage name for matching a single avoid type, e.g. 'match_prefix'. """
+    return f'match_{avoid_type}'
+
+
+class Histogram:
+    """ Counts of observed values per bucket, plus their sum and count, as a Prometheus histogram. """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ Add a value to the first bucket it is less than or equal to. """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        """ Add the observations of another histogram with the same buckets. """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """ Returns (upper bound, observations at or below it) per bucket, the last bound being '+Inf'. """
+
+        total = 0
+        bounds = [str(b) for b in self.buckets] + ['+Inf']
+        pairs = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsRegistry:
+    """ Counters, latency histograms and stage times of the screening pipeline, safe to update from any thread.
+        Stage times add up over a run (e.g. a check or an avoids load), end_run then observes each stage's total
+        in the stage_seconds histogram and starts the next run.
+    """
+
+    def __init__(self, prefix='nameevaluator'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._stages = {}
+        self._run_start = time.perf_counter()
+
+        ### Stage times of the last completed run, see end_run
+        self.last_run = None
+
+    def inc(self, name, value=1, **labels):
+        """ Add value to a counter. """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ Add a value to a histogram. """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._histogram(key).observe(value)
+
+    def merge(self, name, histogram, **labels):
+        """ Add every observation of a Histogram collected elsewhere, e.g. in a worker process. """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._histogram(key).merge(histogram)
+
+    def _histogram(self, key):
+        """ Returns the histogram for key, created on first use. Called with the lock held. """
+
+        if key not in self._histograms:
+            self._histograms[key] = Histogram()
+        return self._histograms[key]
+
+    def add_stage_time(self, stage, seconds):
+        """ Add seconds to a stage of the current run. """
+
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def add_stage_times(self, timings):
+        """ Add a dict of stage: seconds to the current run. """
+
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def end_run(self, kind, fields=None):
+        """ Close the current run, observing each stage's total time. Returns the run, also kept as last_run.
+            fields is a dict of details about the run, e.g. names and avoids counts.
+        """
+
+        now = time.perf_counter()
+        with self._lock:
+            stages, self._stages = self._stages, {}
+            elapsed, self._run_start = now - self._run_start, now
+
+            for stage, seconds in stages.items():
+                self._histogram(('stage_seconds', (('stage', stage),))).observe(seconds)
+            self._histogram(('run_seconds', (('kind', kind),))).observe(elapsed)
+            key = ('runs_total', (('kind', kind),))
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+            self.last_run = {
+                'kind':         kind,
+                'finished_at':  datetime.now().isoformat(timespec='seconds'),
+                'seconds':      elapsed,
+                'fields':       dict(fields or {}),
+                'stages':       stages,
+                }
+            return self.last_run
+
+    def snapshot(self):
+        """ Returns every metric as a JSON serializable dict, with the call trace summary when tracing is enabled. """
+
+        with self._lock:
+            snapshot = {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self._counters.items())
+                    ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'buckets': dict(hist.cumulative()), 'sum': hist.sum, 'count': hist.count}
+                    for (name, labels), hist in sorted(self._histograms.items())
+                    ],
+                'last_run': self.last_run,
+                }
+
+        if TRACER.enabled:
+            snapshot['calls'] = TRACER.summary()
+        return snapshot
+
+    def to_prometheus(self):
+        """ Returns every metric in the Prometheus text exposition format. """
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                full_name = f'{self.prefix}_{name}'
+                if full_name not in typed:
+                    lines.append(f'# TYPE {full_name} counter')
+                    typed.add(full_name)
+                lines.append(f'{full_name}{label_text(labels)} {value}')
+
+            for (name, labels), hist in sorted(self._histograms.items()):
+                full_name = f'{self.prefix}_{name}'
+                if full_name not in typed:
+                    lines.append(f'# TYPE {full_name} histogram')
+                    typed.add(full_name)
+                for bound, count in hist.cumulative():
+                    lines.append(f'{full_name}_bucket{label_text(labels, [("le", bound)])} {count}')
+                lines.append(f'{full_name}_sum{label_text(labels)} {hist.sum}')
+                lines.append(f'{full_name}_count{label_text(labels)} {hist.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_path):
+        """ Write every metric to file_path, as JSON for a .json file and Prometheus text otherwise.
+            Written to a temp file first, so a scraper never reads a partial file.
+        """
+
+        if file_path.lower().endswith('.json'):
+            text = json.dumps(self.snapshot(), indent=2)
+        else:
+            text = self.to_prometheus()
+
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+
+
+### Registry of the running app (or CLI), shared by every module
+METRICS = MetricsRegistry()
+
+
+def report_run(logger, config, kind, fields=None, metrics=METRICS):
+    """ End the current run, log where its time went and export every metric to METRICS_PATH in the config (empty to disable).
+        fields (e.g. names and avoids counts) are logged as structured fields along with the run and its duration.
+    """
+
+    run = metrics.end_run(kind, fields)
+
+    if logger is not None:
+        stages = sorted(run['stages'].items(), key=lambda i: i[1], reverse=True)
+        log_fields = {'run': kind, **run['fields'], 'duration': f"{run['seconds']:.3f}"}
+        logger.info('Metrics | ' + ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in stages), extra={'fields': log_fields})
+
+    file_path = config.get('METRICS_PATH', 'screen_metrics.json')
+    if file_path:
+        try:
+            metrics.write(file_path)
+        except OSError as e:
+            if logger is not None:
+                logger.warning(f'Could not write metrics {file_path}: {e}')
+
+    return run
@@ -0,0 +1,150 @@
+""" Names read from text, CSV or Excel files in chunks, for screening lists too big to hold (or show) all at once.
+    Names are de-duplicated as they stream in and keep their file order, nothing but the current chunk
+    and 8 bytes per distinct name is held in memory.
+"""
+import csv
+from itertools import islice
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import src.utils.constants as c
+from src.utils.check_names import ScreenPool, screen_names
+
+
+class CompactHashSet:
+    """ Set of 64-bit hashes of strings, 8 bytes per member.
+        Members are held in a few sorted numpy arrays, each new batch is added as its own array and arrays
+        of similar size are merged, so membership is a binary search per array and there are O(log n) arrays.
+        Distinct strings sharing a 64-bit hash are taken as the same, which takes billions of names to become likely.
+    """
+
+    def __init__(self):
+        self._levels = []
+
+    def __len__(self):
+        """ Returns number of members. """
+        return sum(len(level) for level in self._levels)
+
+    def add_new(self, values):
+        """ Add a batch of strings, returns bool array True for those not seen before (the first of any repeats in the batch). """
+
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+
+        ### Distinct hashes of the batch come back sorted, which keeps the searches cache friendly
+        distinct, first = np.unique(hashes, return_index=True)
+        unseen = np.ones(len(distinct), dtype=bool)
+        for level in self._levels:
+            pos = np.searchsorted(level, distinct).clip(max=len(level) - 1)
+            unseen &= level[pos] != distinct
+
+        is_new = np.zeros(len(hashes), dtype=bool)
+        is_new[first[unseen]] = True
+
+        if unseen.any():
+            self._levels.append(distinct[unseen])
+
+            ### Merge the newest array into the one before while it is at least half its size,
+            # a stable sort merges the two sorted runs in linear time
+            while len(self._levels) > 1 and 2 * len(self._levels[-1]) >= len(self._levels[-2]):
+                newest = self._levels.pop()
+                self._levels[-1] = np.sort(np.concatenate([self._levels[-1], newest]), kind='stable')
+
+        return is_new
+
+
+def iter_names_file(file_path):
+    """ Yield stripped, non-empty names from a file, in file order.
+        .csv and .xlsx (first sheet) files read the Name column if the first row has one, else the first column;
+        any other file is read as text with one name per line.
+    """
+
+    ext = file_path.rsplit('.', 1)[-1].lower() if '.' in file_path else ''
+
+    if ext == 'xlsx':
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            yield from _iter_column(workbook.worksheets[0].iter_rows(values_only=True))
+        finally:
+            workbook.close()
+
+    elif ext == 'csv':
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            yield from _iter_column(csv.reader(f))
+
+    else:
+        with open(file_path, encoding='utf-8-sig') as f:
+            for line in f:
+                name = line.strip()
+                if name:
+                    yield name
+
+
+def _iter_column(rows):
+    """ Yield stripped, non-empty values of the Name column of rows (case insensitive header), or the first column if none. """
+
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    header = ['' if i is None else str(i).strip() for i in header]
+    lower_header = [i.lower() for i in header]
+    if c.NAME_FIELD.lower() in lower_header:
+        col = lower_header.index(c.NAME_FIELD.lower())
+    else:
+        ### No header, the first row is a name
+        col = 0
+        rows = _chain_row(header, rows)
+
+    for row in rows:
+        if col < len(row) and row[col] is not None:
+            name = str(row[col]).strip()
+            if name:
+                yield name
+
+
+def _chain_row(row, rows):
+    """ Yield row followed by rows. """
+    yield row
+    yield from rows
+
+
+def iter_name_chunks(file_path, chunk_size=None):
+    """ Yield lists of up to chunk_size (STREAM_CHUNK_SIZE by default) names from a file, each name only the first time it is seen.
+        Chunks of names all seen before are skipped, so no chunk is empty.
+    """
+
+    chunk_size = chunk_size or c.STREAM_CHUNK_SIZE
+    seen = CompactHashSet()
+
+    names = iter_names_file(file_path)
+    while True:
+        chunk = list(islice(names, chunk_size))
+        if not chunk:
+            return
+
+        is_new = seen.add_new(chunk)
+        new_names = [name for name, new in zip(chunk, is_new) if new]
+        if new_names:
+            yield new_names
+
+
+def screen_names_file(file_path, avoid_index, allowed, chunk_size=None, workers=None, cache=None, cache_key=(), pool=None):
+    """ Yield (name, hits) for every distinct name in a file, in file order, screening a chunk of names at a time.
+        Every chunk runs on the same ScreenPool, pool if given or one started for this file only,
+        so the workers start and receive the AvoidIndex once per file rather than once per chunk.
+        See screen_names for workers, cache and cache_key.
+    """
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ScreenPool(workers)
+
+    try:
+        for chunk in iter_name_chunks(file_path, chunk_size):
+            yield from screen_names(chunk, avoid_index, allowed, cache=cache, cache_key=cache_key, pool=pool)
+    finally:
+        if own_pool:
+            pool.shutdown()
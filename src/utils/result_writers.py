@@ -0,0 +1,247 @@
+""" Writers streaming screening results to CSV, JSON lines or Excel files a row at a time, and readers for files they wrote.
+    Results are written one row per name with a column per category, or with per_hit one row per conflict
+    (Name, Category, Conflict), which filters and pivots more easily in Excel.
+"""
+import csv
+import json
+import sys
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from itertools import chain
+
+import openpyxl
+
+import src.utils.constants as c
+from src.utils.common_utils import UserError
+
+
+### Extra columns of per_hit rows, after Name
+CATEGORY_HEADER = 'Category'
+CONFLICT_HEADER = 'Conflict'
+
+### Rows per Excel sheet, including the header, further rows continue on a new sheet
+XLSX_MAX_ROWS = 1048576
+
+
+class ResultWriter(ABC):
+    """ Base of the result writers, turning a name's hits into rows for write_row.
+        labels are a dict of category: list of hit display strings, see check_names.group_hit_labels.
+    """
+
+    ### Whether the file is opened in binary mode
+    binary = False
+
+    def __init__(self, file_obj, categories, per_hit=False):
+        self.categories = list(categories)
+        self.per_hit = per_hit
+        self._file = file_obj
+
+    @property
+    def header(self):
+        """ Returns the column names. """
+
+        if self.per_hit:
+            return [c.NAME_FIELD, CATEGORY_HEADER, CONFLICT_HEADER]
+        return [c.NAME_FIELD] + self.categories
+
+    def rows(self, name, labels):
+        """ Yield a name's rows, hits in a cell are joined with newlines as shown in the results table. """
+
+        if self.per_hit:
+            for cat in self.categories:
+                for label in labels.get(cat, ()):
+                    yield [name, cat, label]
+        else:
+            yield [name] + ['\n'.join(labels.get(cat, ())) for cat in self.categories]
+
+    def write(self, name, labels):
+        """ Write one name. """
+
+        for row in self.rows(name, labels):
+            self.write_row(row)
+
+    @abstractmethod
+    def write_row(self, row):
+        """ Write one row of cells, implemented by each format. """
+
+    def close(self):
+        """ Finish the output, the file itself is closed by whoever opened it. """
+
+
+class CsvResultWriter(ResultWriter):
+    """ Streams result rows to a CSV file. """
+
+    def __init__(self, file_obj, categories, per_hit=False):
+        super(CsvResultWriter, self).__init__(file_obj, categories, per_hit)
+        self._writer = csv.writer(file_obj)
+        self._writer.writerow(self.header)
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+
+class JsonlResultWriter(ResultWriter):
+    """ Streams result rows to a JSON lines file, one object per name with a list of hits per category,
+        or with per_hit one object per conflict.
+    """
+
+    def write(self, name, labels):
+        """ Write one name. """
+
+        if self.per_hit:
+            super(JsonlResultWriter, self).write(name, labels)
+            return
+
+        row = {c.NAME_FIELD: name}
+        for cat in self.categories:
+            row[cat] = labels.get(cat, [])
+
+        self._file.write(json.dumps(row) + '\n')
+
+    def write_row(self, row):
+        self._file.write(json.dumps(dict(zip(self.header, row))) + '\n')
+
+
+class XlsxResultWriter(ResultWriter):
+    """ Streams result rows to an Excel workbook.
+        The workbook is write-only, so rows go to a temp file as they are appended rather than being held in memory,
+        and the file is only written on close. Rows past the Excel row limit continue on further sheets.
+    """
+
+    binary = True
+
+    def __init__(self, file_obj, categories, per_hit=False):
+        super(XlsxResultWriter, self).__init__(file_obj, categories, per_hit)
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = None
+        self._sheet_rows = 0
+        self._add_sheet()
+
+    def _add_sheet(self):
+        """ Start a new sheet with the header row. """
+
+        n_sheets = len(self._workbook.worksheets)
+        self._sheet = self._workbook.create_sheet('Results' if n_sheets == 0 else f'Results {n_sheets + 1}')
+        self._sheet.append(self.header)
+        self._sheet_rows = 1
+
+    def write_row(self, row):
+        if self._sheet_rows >= XLSX_MAX_ROWS:
+            self._add_sheet()
+        self._sheet.append(row)
+        self._sheet_rows += 1
+
+    def close(self):
+        """ Write the workbook. """
+        self._workbook.save(self._file)
+
+
+### Writer per output format
+RESULT_WRITERS = {
+    'csv':      CsvResultWriter,
+    'jsonl':    JsonlResultWriter,
+    'xlsx':     XlsxResultWriter,
+}
+
+
+def get_result_format(path, default='csv'):
+    """ Returns the output format for a file path from its extension, default if not a known format. """
+
+    ext = path.rsplit('.', 1)[-1].lower() if path and '.' in path else ''
+    return ext if ext in RESULT_WRITERS else default
+
+
+@contextmanager
+def open_result_writer(file_path, categories, out_format=None, per_hit=False):
+    """ Open file_path (stdout if None) and yield a writer for out_format, from the file extension if not given.
+        The writer is closed (an Excel workbook saved) when the block completes, also if it is left early by a break.
+    """
+
+    out_format = out_format or get_result_format(file_path)
+    writer_class = RESULT_WRITERS[out_format]
+
+    if file_path is None:
+        file_obj = sys.stdout.buffer if writer_class.binary else sys.stdout
+    elif writer_class.binary:
+        file_obj = open(file_path, 'wb')
+    else:
+        file_obj = open(file_path, 'w', newline='', encoding='utf-8')
+
+    try:
+        writer = writer_class(file_obj, categories, per_hit)
+        yield writer
+        writer.close()
+    finally:
+        if file_path is not None:
+            file_obj.close()
+
+
+def write_results(file_path, categories, results, out_format=None, per_hit=False):
+    """ Write (name, labels) pairs of an iterable to file_path, see open_result_writer. Returns the number of names written. """
+
+    written = 0
+    with open_result_writer(file_path, categories, out_format, per_hit) as writer:
+        for name, labels in results:
+            writer.write(name, labels)
+            written += 1
+
+    return written
+
+
+def iter_df_results(results_df):
+    """ Yield (name, labels) for each row of a results dataframe, see check_names.ResultsBuilder. """
+
+    categories = [col for col in results_df.columns if col != c.NAME_FIELD]
+    for row in results_df.itertuples(index=False, name=None):
+        values = dict(zip(results_df.columns, row))
+        yield values[c.NAME_FIELD], {cat: values[cat].split('\n') for cat in categories if values[cat]}
+
+
+def read_results_file(file_path):
+    """ Returns (categories, iterator of (name, labels)) for a results file written a row per name by a result writer.
+        Rows are read as they are iterated, so a file of any size can be converted in constant memory.
+    """
+
+    in_format = get_result_format(file_path, default=None)
+    if in_format is None:
+        raise UserError(f"Unknown results file type: {file_path}, expected one of {', '.join(RESULT_WRITERS)}")
+
+    try:
+        if in_format == 'xlsx':
+            source = openpyxl.load_workbook(file_path, read_only=True)
+            rows = chain.from_iterable(sheet.iter_rows(values_only=True) for sheet in source.worksheets)
+        else:
+            source = open(file_path, newline='', encoding='utf-8-sig')
+            rows = (json.loads(line) for line in source if line.strip()) if in_format == 'jsonl' else csv.reader(source)
+
+        first = next(rows, None)
+    except (OSError, ValueError, KeyError) as e:
+        raise UserError(f"Could not read results file {file_path}: {e}")
+
+    ### JSON lines have no header row, the keys of the first object are the columns
+    header = list(first or [])
+    if header[:1] != [c.NAME_FIELD] or header == [c.NAME_FIELD, CATEGORY_HEADER, CONFLICT_HEADER]:
+        source.close()
+        raise UserError(f"{file_path} is not a results file with a row per name")
+
+    if in_format == 'jsonl':
+        rows = chain([first], rows)
+
+    return header[1:], _iter_results(source, rows, header)
+
+
+def _iter_results(source, rows, header):
+    """ Yield (name, labels) per row, JSON objects or rows of newline-joined cells, closing source when done. """
+
+    try:
+        for row in rows:
+            if isinstance(row, dict):
+                yield row[c.NAME_FIELD], {cat: row[cat] for cat in header[1:] if row.get(cat)}
+            else:
+                cells = ['' if i is None else str(i) for i in row]
+                if cells and cells[0] == c.NAME_FIELD and cells == header:
+                    ### Header of a further sheet
+                    continue
+                yield cells[0], {cat: cell.split('\n') for cat, cell in zip(header[1:], cells[1:]) if cell}
+    finally:
+        source.close()
@@ -0,0 +1,133 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+### Separates the texts in TrigramIndex's joined buffer, queries holding it are verified text by text
+SCAN_SEPARATOR = '\x00'
+
+### Candidates above 1/SCAN_RATIO of the joined texts' length are verified by one scan over every text
+SCAN_RATIO = 64
+
+
+class TrigramIndex:
+    """ Substring search over a fixed list of texts.
+        Each text is indexed by its 1 to 3-letter substrings. Queries of up to 3 letters are answered by their posting list,
+        longer queries only verify the texts holding all of their trigrams.
+        A query extending the previous one (e.g. the next keystroke) is refined from the previous matches where that is smaller.
+        Many candidates are verified at once by a numpy scan of the texts joined as UTF-8, rather than one by one.
+    """
+
+    def __init__(self, texts):
+        self.texts = tuple(texts)
+
+        postings = {}
+        for pos, text in enumerate(self.texts):
+            for gram in {text[i:i+n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}:
+                postings.setdefault(gram, array('i')).append(pos)
+        self._postings = postings
+
+        ### Joined texts as bytes, and the position of the text each byte belongs to
+        encoded = [text.encode('utf-8') for text in self.texts]
+        self._buffer = np.frombuffer(SCAN_SEPARATOR.encode('utf-8').join(encoded + [b'']), dtype=np.uint8)
+        self._text_of = np.repeat(np.arange(len(encoded), dtype=np.int32), [len(text) + 1 for text in encoded])
+
+        ### (query, matches) of the last search
+        self._last = None
+
+    def __len__(self):
+        """ Returns number of texts in the index. """
+        return len(self.texts)
+
+    def search(self, query):
+        """ Returns int array of positions of the texts containing query, in position order. """
+
+        texts = self.texts
+
+        ### Every text contains the empty query
+        if not query:
+            return np.arange(len(texts))
+
+        ### Short queries are in the index as they are, kept as the previous matches for the next keystroke
+        if len(query) <= 3:
+            matches = self._posting(query)
+            self._last = (query, matches)
+            return matches
+
+        ### Rarest trigram first, a missing trigram means nothing can match
+        grams = sorted({query[i:i+3] for i in range(len(query) - 2)}, key=lambda g: len(self._postings.get(g, ())))
+        smallest = len(self._postings.get(grams[0], ()))
+
+        ### A query extending the previous one can only match texts the previous one matched
+        if self._last is not None and self._last[0] in query and len(self._last[1]) <= smallest:
+            candidates = self._last[1]
+        else:
+            candidates = self._posting(grams[0])
+            for gram in grams[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = np.intersect1d(candidates, self._posting(gram), assume_unique=True)
+
+        if len(candidates) > len(self._buffer) // SCAN_RATIO and SCAN_SEPARATOR not in query:
+            matches = self._scan(query)
+        else:
+            matches = np.array([pos for pos in candidates.tolist() if query in texts[pos]], dtype=np.intp)
+
+        self._last = (query, matches)
+        return matches
+
+    def _posting(self, gram):
+        """ Returns int array of positions of the texts containing gram, a view on its posting list. """
+
+        posting = self._postings.get(gram)
+        if posting is None:
+            return np.empty(0, dtype=np.intp)
+        return np.frombuffer(posting, dtype=np.intc)
+
+    def _scan(self, query):
+        """ Returns int array of positions of the texts containing query, found by scanning every text.
+            Starts of the query's first byte are narrowed down a byte at a time, UTF-8 only matching whole characters.
+        """
+
+        buffer = self._buffer
+        pattern = np.frombuffer(query.encode('utf-8'), dtype=np.uint8)
+
+        starts = np.flatnonzero(buffer[:max(len(buffer) - len(pattern) + 1, 0)] == pattern[0])
+        for i in range(1, len(pattern)):
+            starts = starts[buffer[starts + i] == pattern[i]]
+
+        ### Texts containing query more than once are found once per occurrence, in order
+        positions = self._text_of[starts]
+        return positions[np.r_[True, positions[1:] != positions[:-1]]] if len(positions) else positions
+
+
+class RowSearchIndex:
+    """ Substring filter over rows of a dataframe, a row matches if any of the given fields contains the query.
+        Fields such as type and category repeat heavily, so each field indexes its distinct values once
+        and maps matching values back onto rows through their codes.
+    """
+
+    def __init__(self, df, fields, case_sensitive=False):
+        self.case_sensitive = case_sensitive
+        self._fields = []
+
+        for field in fields:
+            values = df[field].astype(str)
+            if not case_sensitive:
+                values = values.str.lower()
+            codes, uniques = pd.factorize(values)
+            self._fields.append((TrigramIndex(uniques), codes))
+
+    def search(self, query):
+        """ Returns boolean array by row position, True where a field contains query. """
+
+        if not self.case_sensitive:
+            query = query.lower()
+
+        rows = None
+        for index, codes in self._fields:
+            matched = np.zeros(len(index), dtype=bool)
+            matched[index.search(query)] = True
+            rows = matched[codes] if rows is None else rows | matched[codes]
+        return rows
@@ -0,0 +1,173 @@
+import time
+import traceback
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import src.utils.constants as c
+
+### The pandas-backed screening modules are imported in ScreenWorker.run, on the worker thread,
+# so importing this module stays cheap on the GUI startup path
+
+
+class FunctionWorker(QObject):
+    """ Runs a single function off the GUI thread, to be moved onto a QThread. """
+
+    ### return value of the function
+    finished = pyqtSignal(object)
+    ### exception, formatted traceback
+    failed = pyqtSignal(object, str)
+
+    def __init__(self, func, *args, **kwargs):
+        super(FunctionWorker, self).__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        """ Call the function, emitting finished with its result or failed with the error. """
+
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.failed.emit(e, traceback.format_exc())
+            return
+
+        self.finished.emit(result)
+
+
+class ScreenWorker(QObject):
+    """ Runs a name screen off the GUI thread, to be moved onto a QThread.
+        Emits progress and partial results as it goes and can be cancelled between names.
+    """
+
+    ### names done, names total, estimated seconds remaining
+    progress = pyqtSignal(int, int, float)
+    ### dataframe of result rows found since the last emit, one column per checked category
+    partial_results = pyqtSignal(object)
+    ### final results dataframe (for the names screened so far if cancelled), True if cancelled
+    finished = pyqtSignal(object, bool)
+    ### exception, formatted traceback
+    failed = pyqtSignal(object, str)
+
+    def __init__(self, names_list, ignore_list, avoid_index, checked_avoids, emit_interval=0.25, cache=None, pool=None):
+        super(ScreenWorker, self).__init__()
+        self.names_list = names_list
+        self.ignore_list = ignore_list
+        self.avoid_index = avoid_index
+        self.checked_avoids = checked_avoids
+        self.emit_interval = emit_interval
+        self.cache = cache
+        self.pool = pool
+        self._cancelled = False
+
+        ### ScreenSession of every name and its hits, set once a check completes without being cancelled
+        self.session = None
+
+    def cancel(self):
+        """ Ask the worker to stop after the current name. Safe to call from the GUI thread. """
+        self._cancelled = True
+
+    def run(self):
+        """ Screen all names, emitting progress/partial_results at most every emit_interval seconds. """
+
+        from src.utils.check_names import ResultsBuilder, ScreenSession, hits_cache_key, screen_names
+
+        try:
+            checked_avoid_categories = [i for i in self.checked_avoids if self.checked_avoids[i] is True]
+            allowed = self.avoid_index.allowed_mask(checked_avoid_categories, self.ignore_list)
+            results = ResultsBuilder(self.avoid_index, checked_avoid_categories)
+            session = ScreenSession(self.avoid_index, checked_avoid_categories, self.ignore_list)
+
+            total = len(self.names_list)
+            start = time.perf_counter()
+            last_emit = start
+            emitted_rows = 0
+            done = 0
+
+            cache_key = hits_cache_key(self.avoid_index, checked_avoid_categories, self.ignore_list)
+            names = screen_names(self.names_list, self.avoid_index, allowed, cache=self.cache, cache_key=cache_key, pool=self.pool)
+            for name, hits in names:
+                if self._cancelled:
+                    names.close()
+                    break
+
+                results.add(name, hits)
+                session.add(name, hits)
+                done += 1
+
+                now = time.perf_counter()
+                if now - last_emit >= self.emit_interval or done == total:
+                    last_emit = now
+                    self.progress.emit(done, total, (now - start) / done * (total - done))
+                    if len(results) > emitted_rows:
+                        self.partial_results.emit(results.rows_df(emitted_rows))
+                        emitted_rows = len(results)
+
+            if not self._cancelled:
+                self.session = session
+            self.finished.emit(results.to_df(), self._cancelled)
+
+        except Exception as e:
+            self.failed.emit(e, traceback.format_exc())
+
+
+class FileScreenWorker(ScreenWorker):
+    """ Screens a names file a chunk at a time off the GUI thread, see name_stream.screen_names_file.
+        Every conflict is written to the results file as it is found, only the first STREAM_PREVIEW_ROWS are kept
+        for the results table, so memory stays bounded whatever the size of the file.
+        Progress has a total of 0, as the number of names is only known once the file is read.
+    """
+
+    def __init__(self, names_path, results_path, ignore_list, avoid_index, checked_avoids, emit_interval=0.25, cache=None, pool=None, per_hit=False):
+        super(FileScreenWorker, self).__init__(None, ignore_list, avoid_index, checked_avoids, emit_interval, cache, pool)
+        self.names_path = names_path
+        self.results_path = results_path
+        self.per_hit = per_hit
+
+        ### Names screened and names with conflicts, final once finished is emitted
+        self.screened = 0
+        self.conflicts = 0
+
+    def run(self):
+        """ Screen the file, writing conflicts and emitting progress/partial_results at most every emit_interval seconds. """
+
+        from src.utils.check_names import ResultsBuilder, group_hit_labels, hits_cache_key
+        from src.utils.name_stream import screen_names_file
+        from src.utils.result_writers import open_result_writer
+
+        try:
+            checked_avoid_categories = [i for i in self.checked_avoids if self.checked_avoids[i] is True]
+            allowed = self.avoid_index.allowed_mask(checked_avoid_categories, self.ignore_list)
+            preview = ResultsBuilder(self.avoid_index, checked_avoid_categories)
+
+            start = time.perf_counter()
+            last_emit = start
+            emitted_rows = 0
+
+            with open_result_writer(self.results_path, checked_avoid_categories, per_hit=self.per_hit) as writer:
+                cache_key = hits_cache_key(self.avoid_index, checked_avoid_categories, self.ignore_list)
+                names = screen_names_file(self.names_path, self.avoid_index, allowed, cache=self.cache, cache_key=cache_key, pool=self.pool)
+                for name, hits in names:
+                    if self._cancelled:
+                        names.close()
+                        break
+
+                    self.screened += 1
+                    if hits:
+                        writer.write(name, group_hit_labels(self.avoid_index, name, hits))
+                        self.conflicts += 1
+                        if len(preview) < c.STREAM_PREVIEW_ROWS:
+                            preview.add(name, hits)
+
+                    now = time.perf_counter()
+                    if now - last_emit >= self.emit_interval:
+                        last_emit = now
+                        self.progress.emit(self.screened, 0, 0.0)
+                        if len(preview) > emitted_rows:
+                            self.partial_results.emit(preview.rows_df(emitted_rows))
+                            emitted_rows = len(preview)
+
+            self.finished.emit(preview.to_df(), self._cancelled)
+
+        except Exception as e:
+            self.failed.emit(e, traceback.format_exc())
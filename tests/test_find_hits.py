@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+import src.utils.constants as c
+from src.utils.avoid_index import TYPE_CHECK_FUNCS, AvoidIndex, Hit, check_string_compare
+
+
+AVOID_TYPES = [c.PREFIX, c.INFIX, c.SUFFIX, c.ANYWHERE, c.NAME_MATCH, c.STRING_COMPARE]
+CATEGORIES = [c.COMPETITOR, c.INN]
+
+
+def random_word(rnd, min_len, max_len):
+    """ Returns a mixed-case word over a small alphabet, so avoids and names share letters often. """
+    return ''.join(rnd.choice('abcdeABD') for _ in range(rnd.randint(min_len, max_len)))
+
+
+def first_offset(name, value, avoid_type):
+    """ Returns where a hit of the avoid type sits in name, None for types checked without a location. """
+
+    if avoid_type == c.PREFIX:
+        return 0
+    if avoid_type == c.SUFFIX:
+        return len(name) - len(value)
+    if avoid_type == c.ANYWHERE:
+        return name.lower().find(value.lower())
+    if avoid_type == c.INFIX:
+        return name[1:-1].find(value) + 1
+    return None
+
+
+def first_n_letters(name, avoid, n):
+    """ Returns (offset, substring) of the first n-letter substring of name in avoid, or None. """
+
+    lname, lavoid = name.lower(), avoid.lower()
+    for i in range(len(name) - (n - 1)):
+        if lname[i:i+n] in lavoid:
+            return i, lname[i:i+n]
+    return None
+
+
+def reference_hits(rows, name, allowed):
+    """ Returns the hits of name one avoid at a time with the check functions, as find_hits orders them. """
+
+    hits = []
+    for pos, (value, avoid_type, category) in enumerate(rows):
+        if allowed[pos] and avoid_type != c.STRING_COMPARE and TYPE_CHECK_FUNCS[avoid_type](name, value):
+            offset = first_offset(name, value, avoid_type)
+            hits.append((pos, avoid_type, offset, None if offset is None else len(value)))
+
+    for pos, (value, avoid_type, category) in enumerate(rows):
+        if not allowed[pos] or avoid_type != c.STRING_COMPARE:
+            continue
+
+        lname, lvalue = name.lower(), value.lower()
+        if check_string_compare(name, value):
+            hits.append((pos, c.STRING_MATCH, 0, len(name)))
+        elif value and lname[0] == lvalue[0] and lname[-3:] == lvalue[-3:]:
+            hits.append((pos, c.STRING_COMPARE_COMBO, None, None))
+        else:
+            ### Longest shared substring first, down to STRING_COMPARE_MINIMUM letters
+            for n in range(len(name), c.STRING_COMPARE_MINIMUM - 1, -1):
+                shared = first_n_letters(name, value, n)
+                if shared is not None:
+                    hits.append((pos, c.N_LETTERS, shared[0], n))
+                    break
+
+    return hits
+
+
+@pytest.mark.parametrize('minimum', [2, 3, 4, 5])
+def test_find_hits_matches_check_functions(monkeypatch, minimum):
+    monkeypatch.setattr(c, 'STRING_COMPARE_MINIMUM', minimum)
+    rnd = random.Random(minimum)
+
+    ### Empty values included, rows kept unique as AvoidIndex de-duplicates them
+    rows = list(dict.fromkeys(
+        (random_word(rnd, 0, 6), rnd.choice(AVOID_TYPES), rnd.choice(CATEGORIES)) for _ in range(400)
+        ))
+    avoid_index = AvoidIndex.from_rows(rows)
+    masks = [bytearray([1]) * len(rows), bytearray(rnd.random() < 0.5 for _ in rows)]
+
+    ### Names from 1 letter, shorter than the minimum, up to longer than any avoid
+    names = [random_word(rnd, 1, 10) for _ in range(300)]
+    for name in names:
+        for allowed in masks:
+            hits = avoid_index.find_hits(name, allowed)
+            expected = reference_hits(rows, name, allowed)
+
+            assert [tuple(hit) for hit in hits] == expected, name
+            assert all(type(hit) is Hit for hit in hits)
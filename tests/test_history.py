@@ -0,0 +1,94 @@
+import time
+
+import src.utils.constants as c
+from src.utils.avoid_index import AvoidIndex
+from src.utils.check_names import hits_cache_key, screen_names
+from src.utils.history import UNRESOLVED_CATEGORY, HistoryStore
+
+
+AVOIDS = [('daxorel', c.STRING_COMPARE, c.COMPETITOR), ('vir', c.SUFFIX, c.INN)]
+CATEGORIES = [c.COMPETITOR, c.INN]
+
+
+def screen(history, names):
+    """ Returns dict of name: hits for names screened against AVOIDS with the current config, through history. """
+
+    avoid_index = AvoidIndex.from_rows(AVOIDS)
+    allowed = avoid_index.allowed_mask(CATEGORIES, [])
+    cache_key = hits_cache_key(avoid_index, CATEGORIES, [])
+    names = screen_names(names, avoid_index, allowed, workers=1, cache=history, cache_key=cache_key)
+    return {name: list(hits) for name, hits in names}
+
+
+def test_history_reused_for_same_config(tmp_path, monkeypatch):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+    first = screen(history, ['midaxum', 'enbrovir'])
+
+    ### Nothing is screened again, every name is read back from the history
+    monkeypatch.setattr(AvoidIndex, 'find_hits', lambda *args: 1 / 0)
+    assert screen(history, ['midaxum', 'enbrovir']) == first
+    history.close()
+
+
+def test_history_not_reused_after_string_compare_minimum_change(tmp_path, monkeypatch):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+
+    monkeypatch.setattr(c, 'STRING_COMPARE_MINIMUM', 3)
+    assert [hit.match for hit in screen(history, ['midaxum'])['midaxum']] == [c.N_LETTERS]
+
+    ### 'dax' is shorter than the new minimum, the 3-letter hit saved above must not be served
+    monkeypatch.setattr(c, 'STRING_COMPARE_MINIMUM', 5)
+    assert screen(history, ['midaxum']) == {'midaxum': []}
+    history.close()
+
+
+def test_prune_deletes_old_screens_and_unused_avoid_sets(tmp_path, monkeypatch):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+    history.add_avoid_set(AvoidIndex.from_rows(AVOIDS))
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 10 * 86400)
+    screen(history, ['midaxum'])
+    monkeypatch.setattr(time, 'time', lambda: now)
+    screen(history, ['enbrovir'])
+
+    assert history.prune(30) == 0
+    assert history.prune(5) == 1
+    assert [entry.name for entry in history.find('midaxum')] == []
+    assert [entry.name for entry in history.find('enbrovir')] == ['enbrovir']
+
+    assert history.prune(0.5) == 0
+    monkeypatch.setattr(time, 'time', lambda: now + 86400)
+    assert history.prune(0.5) == 1
+    assert history._conn.execute('SELECT COUNT(*) FROM avoid_sets').fetchone()[0] == 0
+    history.close()
+
+
+def test_prune_from_another_session_keeps_avoid_set_in_use(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'history.db')
+    session = HistoryStore(db_path)
+    session.add_avoid_set(AvoidIndex.from_rows(AVOIDS))
+
+    ### Another session prunes an old screen while this one has loaded avoids but not checked a name yet
+    other = HistoryStore(db_path)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 200 * 86400)
+    screen(other, ['enbrovir'])
+    monkeypatch.setattr(time, 'time', lambda: now)
+    assert other.prune(180) == 1
+    other.close()
+
+    hits = screen(session, ['midaxum'])['midaxum']
+    assert [hit.match for hit in hits] == [c.N_LETTERS]
+    assert [category for category, label in session.find('midaxum')[0].conflicts] == [c.COMPETITOR]
+    session.close()
+
+
+def test_unresolved_hits_are_listed(tmp_path):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+
+    ### No avoid set stored for the screen, its conflicts are flagged rather than reported as clean
+    screen(history, ['midaxum'])
+    [entry] = history.find('midaxum')
+    assert entry.conflicts == [(UNRESOLVED_CATEGORY, '<avoid #0 not stored> (*dax*)')]
+    history.close()